@@ -1,21 +1,32 @@
 import streamlit as st
-from PIL import Image
 import ocr_utils
 import report_utils
 import db_utils
+import phash_utils
+import image_utils
+import job_utils
+import worker
 import chatbot_utils
+import llm_utils
+import normalize_utils
+import stats_utils
+import sentiment_utils
 import pandas as pd
 import datetime
 import os
-import concurrent.futures
 import altair as alt
 from st_aggrid import AgGrid, GridOptionsBuilder
 
 # Page Config
 st.set_page_config(page_title="Customer Review Intelligence", layout="wide")
 
-# Initialize DB (safe to call multiple times as it uses IF NOT EXISTS)
-db_utils.init_db()
+# Initialize DB (once per server process, and only if the schema version is behind).
+# Runs in the background so the page renders while the database wakes up.
+db_utils.start_schema_bootstrap()
+
+# Background jobs (extraction, reports) run in this process unless JOB_WORKER = "external"
+if job_utils.embedded_worker_enabled():
+    worker.start_embedded_workers()
 
 
 # Header
@@ -133,18 +144,26 @@ with tab1:
     if not is_admin:
         st.info("👀 **Read-Only Mode**: You can extract data to test the OCR, but saving is disabled.")
 
-    if uploaded_files:
-        # If only one file, wrap in list for consistent handling if needed, but uploaded_files is already a list
-        st.write(f"Uploaded {len(uploaded_files)} images.")
-        
-        if st.button("Extract Data from All"):
+    # A running extraction job outlives reruns and reloads (its id is kept in the URL)
+    extract_job_id = st.session_state.get('extract_job') or st.query_params.get('extract_job')
+    if extract_job_id is not None and not str(extract_job_id).isdigit():
+        # Hand-edited or stale link; ignore it rather than fail the whole page
+        st.query_params.pop('extract_job', None)
+        extract_job_id = None
+    
+    if uploaded_files or extract_job_id or st.session_state.get('extracted_data_list'):
+        if uploaded_files:
+            # If only one file, wrap in list for consistent handling if needed, but uploaded_files is already a list
+            st.write(f"Uploaded {len(uploaded_files)} images.")
+            reprocess_duplicates = st.checkbox("Re-process likely duplicates", value=False,
+                                               help="By default, screenshots that look like images already processed are skipped before OCR.")
+        
+        if uploaded_files and st.button("Extract Data from All"):
             # Clear existing session data for fresh upload
             st.session_state['extracted_data_list'] = []
+            st.session_state.pop('extract_job_result', None)
             
-            all_extracted_data = []
-            progress_bar = st.progress(0)
-            
-            # 1. Pre-save all images to disk (Fast I/O)
+            # 1. Hash uploads in memory; copies for uploads/ are written in the background
             saved_files = []
             uploads_dir = "uploads"
             os.makedirs(uploads_dir, exist_ok=True)
@@ -154,52 +173,116 @@ with tab1:
                 st.warning("⚠️ Read-Only Limit: Processing only the first 10 images.")
                 uploaded_files = uploaded_files[:10]
 
+            near_duplicates = []
+            staged_bytes = {}
+            upload_writer = image_utils.BackgroundWriter()
             with st.spinner("Preparing images..."):
+                # Perceptual-hash index of everything already in uploads/
+                hash_index = phash_utils.get_image_hash_index()
+                hash_index.sync_directory(uploads_dir)
+                batch_hashes = []
+                
                 for uploaded_file in uploaded_files:
-                    file_path = os.path.join(uploads_dir, uploaded_file.name)
-                    with open(file_path, "wb") as f:
-                        f.write(uploaded_file.getbuffer())
-                    saved_files.append((uploaded_file.name, file_path))
-
-            # 2. Parallel Extraction
-            def process_single_image(file_info):
-                fname, fpath = file_info
-                try:
-                    with Image.open(fpath) as img:
-                        # Ensure image is loaded
-                        img.load()
-                        result = ocr_utils.extract_review_data(img)
-                    return result, fname, fpath
-                except Exception as e:
-                    return {"error": str(e)}, fname, fpath
-
-            with st.spinner(f"Analyzing {len(saved_files)} images in parallel..."):
-                with concurrent.futures.ThreadPoolExecutor() as executor:
-                    futures = [executor.submit(process_single_image, f) for f in saved_files]
+                    image_bytes = uploaded_file.getvalue()
+                    phash = phash_utils.dhash_bytes(image_bytes)
                     
-                    for i, future in enumerate(concurrent.futures.as_completed(futures)):
-                        data, fname, fpath = future.result()
-                        
-                        if "error" in data:
-                            st.error(f"Error processing {fname}: {data['error']}")
-                        else:
-                            # Batch duplicate check logic
-                            is_duplicate = False
-                            for existing in all_extracted_data:
-                                if existing.get('user_name') == data.get('user_name') and existing.get('content') == data.get('content'):
-                                    is_duplicate = True
+                    # Skip near-identical screenshots before they cost a model call
+                    # (exact repeats with a cached extraction are free, so let those through)
+                    if not reprocess_duplicates and not ocr_utils.is_extraction_cached(image_bytes):
+                        match = hash_index.find_match(phash)
+                        if match is None:
+                            for other_name, other_hash in batch_hashes:
+                                distance = phash_utils.hash_distance(phash, other_hash)
+                                if distance <= phash_utils.DEFAULT_THRESHOLD:
+                                    match = (other_name, distance)
                                     break
-                            
-                            if not is_duplicate:
-                                data['source_filename'] = fname
-                                data['image_path'] = fpath
-                                all_extracted_data.append(data)
-                            else:
-                                print(f"Duplicate found in batch: {data.get('user_name')} - {fname}")
-                        
-                        progress_bar.progress((i + 1) / len(saved_files))
+                        if match is not None:
+                            near_duplicates.append((uploaded_file.name, match[0], match[1]))
+                            continue
+                    
+                    file_path = os.path.join(uploads_dir, uploaded_file.name)
+                    upload_writer.submit(file_path, image_bytes)
+                    saved_files.append((uploaded_file.name, file_path))
+                    staged_bytes[uploaded_file.name] = image_bytes
+                    batch_hashes.append((uploaded_file.name, phash))
+                # The worker adds each image to hash_index once its extraction succeeds,
+                # so an upload that failed can simply be uploaded again
+            
+            if near_duplicates:
+                st.warning(f"⏭️ Skipped {len(near_duplicates)} likely duplicate screenshots (already processed):")
+                for fname, match_name, distance in near_duplicates:
+                    st.caption(f"• {fname} ≈ {match_name} (difference: {distance} bits)")
+
+            # An embedded worker gets the bytes in memory and extracts while uploads/ is
+            # written; an external one reads the files, so they must be on disk first
+            embedded = job_utils.embedded_worker_enabled()
+            write_errors = [] if embedded else upload_writer.close()
             
-            st.session_state['extracted_data_list'] = all_extracted_data
+            # 2. Extraction runs as a background job (see worker.py)
+            if saved_files:
+                job_id = job_utils.submit_job('extract', {'files': [list(f) for f in saved_files]},
+                                              staged=staged_bytes if embedded else None)
+                if job_id is None:
+                    st.error("Could not queue the extraction job. Please try again.")
+                else:
+                    st.session_state['extract_job'] = job_id
+                    st.query_params['extract_job'] = str(job_id)
+                    extract_job_id = job_id
+            if embedded:
+                write_errors = upload_writer.close()
+            for fpath, error in write_errors:
+                st.error(f"Could not save {os.path.basename(fpath)} to uploads/: {error}")
+        
+        @st.fragment(run_every=2)
+        def show_extract_job(job_id):
+            job = job_utils.get_job(job_id)
+            if job is not None and job['status'] in job_utils.ACTIVE_STATUSES:
+                if job['status'] == 'queued':
+                    st.progress(0.0, text="Queued, waiting for a worker...")
+                else:
+                    st.progress(job['progress'], text=job['progress_message'] or "Analyzing images...")
+                return
+            
+            st.session_state.pop('extract_job', None)
+            st.query_params.pop('extract_job', None)
+            if job is None:
+                st.session_state['extract_job_result'] = {'failed': "Extraction job not found."}
+            elif job['status'] == 'failed':
+                st.session_state['extract_job_result'] = {'failed': job['error']}
+            else:
+                st.session_state['extract_job_result'] = job['result']
+                st.session_state['extracted_data_list'] = job['result']['records']
+            st.rerun()
+        
+        if extract_job_id:
+            show_extract_job(int(extract_job_id))
+        
+        job_result = st.session_state.get('extract_job_result')
+        if job_result and 'failed' in job_result:
+            st.error(f"Extraction failed: {job_result['failed']}")
+        elif job_result:
+            for fname, error in job_result['errors']:
+                st.error(f"Error processing {fname}: {error}")
+            for fname in job_result['duplicates']:
+                print(f"Duplicate found in batch: {fname}")
+            
+            latencies = job_result['latencies']
+            if latencies:
+                cache_hits = job_result['cache_hits']
+                st.caption(f"⚡ Extraction cache: {cache_hits}/{len(latencies)} images reused "
+                           f"({cache_hits / len(latencies):.0%} hit rate), {len(latencies) - cache_hits} sent to Gemini.")
+                seconds = pd.Series([row['Seconds'] for row in latencies])
+                st.caption(f"⏱️ Per-image latency: p50 {seconds.quantile(0.5):.1f}s, p95 {seconds.quantile(0.95):.1f}s, "
+                           f"max {seconds.max():.1f}s · {job_result['requests']} Gemini requests, "
+                           f"{job_result['retries']} retries, "
+                           f"{job_result['throttle_wait']:.1f}s waiting on rate limits")
+                if job_result.get('responses'):
+                    unparseable = job_result['repaired'] + job_result['parse_failed']
+                    st.caption(f"🧩 Structured output: {unparseable}/{job_result['responses']} answers failed to parse "
+                               f"({unparseable / job_result['responses']:.0%}); {job_result['repaired']} fixed by a repair pass, "
+                               f"{job_result['parse_failed']} wasted.")
+                with st.expander("Per-image timings"):
+                    st.dataframe(pd.DataFrame(latencies).sort_values('Seconds', ascending=False), hide_index=True)
             
         if 'extracted_data_list' in st.session_state and st.session_state['extracted_data_list']:
             st.subheader("Extracted Data Preview")
@@ -223,74 +306,100 @@ with tab1:
                     st.caption("🔒 Admin access required to save changes.")
                 
             if submitted:
-                saved_count = 0
-                for data in st.session_state['extracted_data_list']:
-                    # Clean date logic (reused)
-                    raw_date = data.get('review_date')
-                    try:
-                        if raw_date and len(raw_date) <= 5:
-                            # Handle MM/DD format with custom year logic
-                            clean_raw = raw_date.replace('/', '-')
-                            parts = clean_raw.split('-')
-                            if len(parts) == 2:
-                                try:
-                                    # month = int(parts[0]) 
-                                    # Always 2026 as per user request
-                                    raw_date = f"2026-{parts[0]}-{parts[1]}"
-                                except ValueError:
-                                    pass # Fallback to standard parsing
-                        parsed_date = pd.to_datetime(raw_date).strftime('%Y-%m-%d')
-                        data['review_date'] = parsed_date
-                    except:
-                        data['review_date'] = datetime.date.today().strftime('%Y-%m-%d')
-                    
-                    # Check duplicate
-                    if not db_utils.check_duplicate(data.get('user_name'), data.get('content')):
-                        if db_utils.insert_review(data):
-                            saved_count += 1
+                # Dates and ratings are parsed and validated for the whole batch at once
+                review_batch = normalize_utils.normalize_records(st.session_state['extracted_data_list'])
+                for problem in review_batch.errors:
+                    data = st.session_state['extracted_data_list'][problem['row']]
+                    st.warning(f"{data.get('source_filename')}: {problem['message']} ({problem['field']})")
                 
-                st.success(f"✅ Successfully saved {saved_count} new reviews!")
-                # Clear cache to reflect new data
-                db_utils.get_all_reviews.clear()
-                
-                # Optional: Clear state or keep for reference? Let's clear to avoid double save confusion
-                del st.session_state['extracted_data_list']
-                st.rerun()
+                # One transaction for the whole batch; duplicates are skipped server-side
+                result = db_utils.insert_reviews_bulk(review_batch)
+                if result is None:
+                    # Nothing was written; keep the extracted reviews so the save can be retried
+                    st.error("❌ Could not save the reviews to the database. Nothing was saved; please try again.")
+                else:
+                    inserted, skipped = result
+                    saved_count = len(inserted)
+                    
+                    st.success(f"✅ Successfully saved {saved_count} new reviews!")
+                    if skipped:
+                        st.info(f"Skipped {len(skipped)} duplicate reviews.")
+                    # Pull the new rows into the cached table on the next read
+                    db_utils.invalidate_reviews_cache()
+                    db_utils.get_reviews.clear()
+                    
+                    # Optional: Clear state or keep for reference? Let's clear to avoid double save confusion
+                    del st.session_state['extracted_data_list']
+                    st.rerun()
 
 with tab2:
     
-    # Fetch reviews
-    df = db_utils.get_all_reviews()
+    st.markdown("### Manage Reviews")
     
-    if not df.empty:
-        # Reorder columns for better view
-        cols = ['id', 'user_name', 'review_date', 'rating_overall', 'rating_taste', 'rating_env', 'rating_service', 'rating_value', 'content', 'source_filename']
-        # Ensure columns exist in DF (migration might have just added them, old rows might have NaN)
-        existing_cols = [c for c in cols if c in df.columns]
-        df_display = df[existing_cols].copy()
-        
+    # Sorting and filtering run in SQL; the grid only ever receives one page
+    with st.expander("🔎 Filter & Sort", expanded=False):
+        f1, f2, f3 = st.columns(3)
+        with f1:
+            filter_dates = st.date_input("Review Date Range", value=(), key="db_filter_dates")
+            filter_min_rating = st.slider("Minimum Overall Rating", 0.0, 5.0, 0.0, 0.5, key="db_filter_min_rating")
+        with f2:
+            filter_user = st.text_input("User Name Contains", key="db_filter_user")
+            filter_text = st.text_input("Review Text Contains", key="db_filter_text")
+        with f3:
+            sort_by = st.selectbox("Sort By", db_utils.PAGE_SORT_COLUMNS, key="db_sort_by")
+            sort_desc = st.radio("Order", ["Descending", "Ascending"], horizontal=True, key="db_sort_order") == "Descending"
+            page_size = st.selectbox("Rows per Page", [20, 50, 100], key="db_page_size")
+    
+    db_filters = {
+        'min_rating': filter_min_rating if filter_min_rating > 0 else None,
+        'user_name': filter_user.strip() or None,
+        'text': filter_text.strip() or None,
+    }
+    if isinstance(filter_dates, tuple) and len(filter_dates) == 2:
+        db_filters['start'], db_filters['end'] = filter_dates
+    
+    # Keyset cursors for the pages visited so far; reset whenever the query changes
+    page_signature = (tuple(sorted(db_filters.items(), key=lambda kv: kv[0])), sort_by, sort_desc, page_size)
+    if st.session_state.get('db_page_signature') != page_signature:
+        st.session_state['db_page_signature'] = page_signature
+        st.session_state['db_page_cursors'] = [None]
+    page_cursors = st.session_state['db_page_cursors']
+    
+    total_matching = db_utils.count_reviews(db_filters)
+    if total_matching is None:
+        # Database unreachable (e.g. still waking up); let the other tabs render
+        df_display, next_cursor = pd.DataFrame(), None
+    else:
+        df_display, next_cursor = db_utils.get_reviews_page(
+            columns=db_utils.DISPLAY_COLUMNS,
+            sort_by=sort_by,
+            descending=sort_desc,
+            after=page_cursors[-1],
+            filters=db_filters,
+            page_size=page_size
+        )
+    
+    if not df_display.empty:
         # Ensure review_date is string for AgGrid
         if 'review_date' in df_display.columns:
             df_display['review_date'] = pd.to_datetime(df_display['review_date']).dt.strftime('%Y-%m-%d')
 
-        st.markdown("### Manage Reviews")
-        
         if is_admin:
-            st.caption("💡 Tip: Click column headers to sort. Use the menu in headers to filter. Select rows to delete (Admin).")
+            st.caption("💡 Tip: Use Filter & Sort above to search the whole table. Select rows to delete (Admin).")
         else:
-             st.caption("💡 Tip: Click column headers to sort. Filtering available. Read-Only Mode.")
+             st.caption("💡 Tip: Use Filter & Sort above to search the whole table. Read-Only Mode.")
         
         # Configure AgGrid
         gb = GridOptionsBuilder.from_dataframe(df_display)
-        gb.configure_pagination(paginationAutoPageSize=False, paginationPageSize=20) # Add pagination
         gb.configure_side_bar() # Add a sidebar
-        gb.configure_default_column(groupable=True, value=True, enableRowGroup=True, aggFunc='sum', editable=is_admin)
+        # Sorting/filtering inside the grid would only see the current page
+        gb.configure_default_column(groupable=True, value=True, enableRowGroup=True, aggFunc='sum', editable=is_admin, sortable=False, filter=False)
         
         # Configure specific columns
         gb.configure_column("id", editable=False)
         gb.configure_column("source_filename", editable=False)
-        gb.configure_column("review_date", type=["dateColumnFilter", "customDateTimeFormat"], custom_format_string='yyyy-MM-dd')
-        gb.configure_column("rating_overall", type=["numericColumn", "numberColumnFilter", "customNumericFormat"], precision=1)
+        gb.configure_column("review_date", type=["customDateTimeFormat"], custom_format_string='yyyy-MM-dd')
+        gb.configure_column("rating_overall", type=["numericColumn", "customNumericFormat"], precision=1)
         
         # Selection
         gb.configure_selection('multiple', use_checkbox=True, groupSelectsChildren="Group checkbox select children")
@@ -306,26 +415,44 @@ with tab2:
             enable_enterprise_modules=False,
             height=500, 
             width='100%',
-            reload_data=False
+            reload_data=True
         )
         
-
-            
-        # CSV Export
-        # Use df_display (the filtered view) for export, or grid data if available
-        export_df = df_display # Default to what was passed to grid
-        if 'grid_response' in locals() and grid_response['data'] is not None and len(grid_response['data']) > 0:
-             export_df = pd.DataFrame(grid_response['data'])
+        # Pager
+        page_number = len(page_cursors)
+        first_row = (page_number - 1) * page_size + 1
+        p1, p2, p3 = st.columns([1, 2, 1])
+        with p1:
+            if st.button("◀ Previous", disabled=page_number == 1, key="db_prev_page"):
+                page_cursors.pop()
+                st.rerun()
+        with p2:
+            st.caption(f"Rows {first_row}–{first_row + len(df_display) - 1} of {total_matching}")
+        with p3:
+            if st.button("Next ▶", disabled=next_cursor is None, key="db_next_page"):
+                page_cursors.append(next_cursor)
+                st.rerun()
             
-        csv = export_df.to_csv(index=False).encode('utf-8')
+        # CSV Export (every row matching the current filters, not just this page)
+        # Streamed from the DB only when the button is clicked
+        export_filters = dict(db_filters)
+
+        def export_csv():
+            with db_utils.export_reviews_csv(columns=db_utils.DISPLAY_COLUMNS, filters=export_filters) as f:
+                return f.read()
+
         st.download_button(
             label="Download as CSV",
-            data=csv,
+            data=export_csv,
             file_name='reviews_export.csv',
             mime='text/csv',
         )
-    else:
+    elif total_matching is None:
+        st.warning("⏳ The database isn't reachable right now (it may be waking up). Please try again in a moment.")
+    elif total_matching == 0 and len(page_cursors) == 1 and not any(v is not None for v in db_filters.values()):
         st.info("No reviews found in the database.")
+    else:
+        st.info("No reviews match the current filters.")
 
 with tab3:
     
@@ -347,7 +474,7 @@ with tab3:
               st.markdown("### Southern Frontier Assistant")
               
               # Check validity
-              if not chatbot_utils.configure_genai():
+              if not llm_utils.configure():
                   st.warning("⚠️ Google API Key not found.")
                   st.stop()
 
@@ -379,7 +506,10 @@ with tab3:
                       # Gather Context
                       report_context = st.session_state.get('generated_report', "")
                       analysis_df = st.session_state.get('analysis_df', pd.DataFrame())
-                      data_context = chatbot_utils.get_data_context(analysis_df)
+                      # Analysis data carries no review text, so fetch just the latest few for examples
+                      range_start, range_end = st.session_state.get('analysis_range', (None, None))
+                      sample_df = db_utils.get_reviews(columns=db_utils.REPORT_COLUMNS, start=range_start, end=range_end, limit=5, order_by='review_date')
+                      data_context = chatbot_utils.get_data_context(analysis_df, sample_df=sample_df)
                       
                       try:
                           # Stream response
@@ -403,16 +533,15 @@ with tab3:
                       except Exception as e:
                           st.error(f"Error generating response: {e}")
 
-    # Fetch reviews
-    df_analysis = db_utils.get_all_reviews()
+    # Fetch reviews (full history for rolling stats, but no text columns)
+    # Served from the local snapshot + delta cache, so this rarely touches the DB
+    # Prepared reviews and daily stats are cached until the reviews change
+    store, daily_stats = stats_utils.get_analysis_data()
     
-    if not df_analysis.empty:
-        # Ensure date is datetime for calculations
-        df_analysis['review_date'] = pd.to_datetime(df_analysis['review_date'])
-        
+    if not store.empty:
         # Date Filter
-        min_date = df_analysis['review_date'].min().date()
-        max_date = df_analysis['review_date'].max().date()
+        min_date = store.min_date
+        max_date = store.max_date
         
         col_filter, col_spacer = st.columns([1, 2])
         with col_filter:
@@ -423,78 +552,23 @@ with tab3:
                 max_value=max_date
             )
         
-        # Filter logic
+        # Filter logic (binary search on the store's sorted date index)
         if isinstance(date_range, tuple) and len(date_range) == 2:
-            start_date, end_date = date_range
-            mask = (df_analysis['review_date'].dt.date >= start_date) & (df_analysis['review_date'].dt.date <= end_date)
-            df_filtered = df_analysis.loc[mask]
-        else:
-            # If single date selected or invalid range, just show all or handle gracefully
+            range_start, range_end = date_range
+        elif isinstance(date_range, tuple) and len(date_range) == 1:
             # Usually streamlit returns a single date if only one is picked so far
-            if isinstance(date_range, tuple) and len(date_range) == 1:
-                 mask = (df_analysis['review_date'].dt.date == date_range[0])
-                 df_filtered = df_analysis.loc[mask]
-            else:
-                 df_filtered = df_analysis
+            range_start = range_end = date_range[0]
+        else:
+            range_start = range_end = None
+        df_filtered = store.range(range_start, range_end)
             
-        # --- Pre-calculation for Advanced Charts ---
-        # Sort by date for rolling calcs
-        df_sorted = df_analysis.sort_values('review_date')
-        
-        # 1. 7-Day Moving Averages (Weighted by individual reviews)
-        # We calculate rolling mean on the raw data
-        # Note: This is a simple moving average of the reviews in the window
-        df_sorted['mov_avg_overall'] = df_sorted['rating_overall'].rolling(window=7, min_periods=1).mean()
-        df_sorted['mov_avg_taste'] = df_sorted['rating_taste'].rolling(window=7, min_periods=1).mean()
-        df_sorted['mov_avg_env'] = df_sorted['rating_env'].rolling(window=7, min_periods=1).mean()
-        df_sorted['mov_avg_service'] = df_sorted['rating_service'].rolling(window=7, min_periods=1).mean()
-        df_sorted['mov_avg_value'] = df_sorted['rating_value'].rolling(window=7, min_periods=1).mean()
-        
-        # Group by date to get daily stats
-        # For daily avg, we just take the mean of that day
-        # For moving avg, we take the LAST value of that day (state at end of day)
-        daily_stats = df_sorted.groupby(df_sorted['review_date'].dt.date).agg({
-            'rating_overall': 'mean',
-            'rating_taste': 'mean',
-            'rating_env': 'mean',
-            'rating_service': 'mean',
-            'rating_value': 'mean',
-            'mov_avg_overall': 'last',
-            'mov_avg_taste': 'last',
-            'mov_avg_env': 'last',
-            'mov_avg_service': 'last',
-            'mov_avg_value': 'last',
-            'id': 'count' # Daily review count
-        }).rename(columns={'id': 'daily_count'})
-        
-        # 2. Rolling 7-Day Count
-        # We need a complete date index to ensure rolling window accounts for days with 0 reviews
-        full_date_range = pd.date_range(start=daily_stats.index.min(), end=daily_stats.index.max(), freq='D').date
-        daily_stats = daily_stats.reindex(full_date_range)
-        
-        # Fill NaNs for daily metrics (0 reviews)
-        daily_stats['daily_count'] = daily_stats['daily_count'].fillna(0)
-        # For ratings, we forward fill moving avg (state persists) and leave daily as NaN (no data points)
-        cols_mov = ['mov_avg_overall', 'mov_avg_taste', 'mov_avg_env', 'mov_avg_service', 'mov_avg_value']
-        daily_stats[cols_mov] = daily_stats[cols_mov].ffill()
-        
-        # Calculate Rolling 7-Day Sum
-        daily_stats['rolling_7d_count'] = daily_stats['daily_count'].rolling(window=7, min_periods=1).sum()
-        
         # --- Filter for Display ---
-        # Now we filter the PRE-CALCULATED daily_stats based on user selection
-        if isinstance(date_range, tuple) and len(date_range) == 2:
-            start_date, end_date = date_range
-            mask_daily = (daily_stats.index >= start_date) & (daily_stats.index <= end_date)
-            daily_stats_filtered = daily_stats.loc[mask_daily]
-        elif isinstance(date_range, tuple) and len(date_range) == 1:
-             mask_daily = (daily_stats.index == date_range[0])
-             daily_stats_filtered = daily_stats.loc[mask_daily]
-        else:
-             daily_stats_filtered = daily_stats
+        # Only the slice of the PRE-CALCULATED daily_stats is recomputed per rerun
+        daily_stats_filtered = stats_utils.slice_daily(daily_stats, range_start, range_end)
 
         # Store filtered dataframe for the chatbot to access
         st.session_state['analysis_df'] = df_filtered
+        st.session_state['analysis_range'] = (range_start, range_end)
 
         # Topline Metrics Calculation (using df_filtered for raw counts/avgs in range)
         # ... (Metrics calculation remains same as it uses raw filtered df) ...
@@ -502,10 +576,7 @@ with tab3:
         total_reviews = len(df_filtered)
         
         # 2. New Reviews (Last 7 Days)
-        today = df_analysis['review_date'].max().date() if not df_analysis.empty else datetime.date.today()
-        seven_days_ago = today - datetime.timedelta(days=7)
-        mask_7d = (df_analysis['review_date'].dt.date >= seven_days_ago) & (df_analysis['review_date'].dt.date <= today)
-        df_7d = df_analysis.loc[mask_7d]
+        df_7d = store.last_n_days(7)
         new_reviews_7d = len(df_7d)
         
         # 3. Avg Rating (Selected Range)
@@ -581,30 +652,16 @@ with tab3:
         st.subheader("📊 Daily Sentiment Breakdown")
         
         if not df_filtered.empty:
-            # Prepare Data
-            df_breakdown = df_filtered.copy()
-            
-            def classify_sentiment(val):
-                if val >= 4.5:
-                    return 'Positive'
-                elif val > 3.5:
-                    return 'Neutral'
-                else:
-                    return 'Negative'
-            
-            df_breakdown['sentiment'] = df_breakdown['rating_overall'].apply(classify_sentiment)
-            df_breakdown['date'] = df_breakdown['review_date'].dt.date
-            
-            # Aggregate for Altair (Long Format)
-            chart_data = df_breakdown.groupby(['date', 'sentiment']).size().reset_index(name='count')
+            # Aggregate for Altair (Long Format); date and sentiment are precomputed by the store
+            chart_data = df_filtered.groupby(['date', 'sentiment'], observed=True).size().reset_index(name='count')
             
             # Use 'review_date' str for better Altair x-axis or just date object
             # Altair handles date objects well.
             
             # Define Color Scale
             color_scale = alt.Scale(
-                domain=['Positive', 'Neutral', 'Negative'],
-                range=['green', 'lightblue', 'red']
+                domain=sentiment_utils.LABELS,
+                range=['green', 'lightblue', 'red', 'lightgray']
             )
             
             # Chart 1: Counts
@@ -710,59 +767,54 @@ with tab3:
                     mime="application/vnd.openxmlformats-officedocument.presentationml.presentation"
                 )
 
-        # Logic for generation
+        # Generation runs as a background job (see worker.py); its id is kept in the URL,
+        # so a rerun or page reload picks the running report back up
+        report_job_id = st.session_state.get('report_job') or st.query_params.get('report_job')
         if generate_clicked:
-            with status_area:
-                with st.spinner(f"Generating insights from reviews in selected range ({language})..."):
-                    if not df_filtered.empty:
-                        # Prepare data for AI
-                        df_for_ai = df_filtered.copy()
-                        df_for_ai['review_date'] = df_for_ai['review_date'].dt.strftime('%Y-%m-%d')
-                        reviews_list = df_for_ai[['user_name', 'rating_overall', 'content', 'review_date']].to_dict(orient='records')
-                        
-                        report_stream = ocr_utils.analyze_sentiment_batch(reviews_list, language=language, stream=True)
-                        
-                        full_report = ""
-                        report_placeholder = st.empty()
-                        
-                        if isinstance(report_stream, str) and report_stream.startswith("Error"):
-                             st.error(report_stream)
-                             full_report = report_stream # Or keep empty, but show error
-                        else:
-                            try:
-                                for chunk in report_stream:
-                                    if hasattr(chunk, 'text'):
-                                        full_report += chunk.text
-                                        report_placeholder.markdown(full_report + "▌")
-                                report_placeholder.markdown(full_report)
-                            except Exception as e:
-                                st.error(f"Stream error: {str(e)}")
-                                full_report = f"Error during generation: {str(e)}"
-                        st.session_state['generated_report'] = full_report
-                        
-                        # Store exact metadata
-                        if not df_filtered.empty:
-                            actual_min = df_filtered['review_date'].min().strftime('%Y-%m-%d')
-                            actual_max = df_filtered['review_date'].max().strftime('%Y-%m-%d')
-                            count = len(df_filtered)
-                        else:
-                            actual_min = actual_max = "N/A"
-                            count = 0
-                            
-                        st.session_state['report_metadata'] = {
-                            'start_date': actual_min,
-                            'end_date': actual_max,
-                            'count': count,
-                            'generated_on': datetime.date.today().strftime('%Y-%m-%d')
-                        }
-                        
-                        # Increment Usage Counter
-                        st.session_state['report_gen_count'] += 1
-                    else:
-                        st.warning("No reviews found in the selected date range to analyze.")
+            if df_filtered.empty:
+                st.warning("No reviews found in the selected date range to analyze.")
+            else:
+                report_job_id = job_utils.submit_job('report', {
+                    'start': str(range_start) if range_start else None,
+                    'end': str(range_end) if range_end else None,
+                    'language': language,
+                })
+                if report_job_id is None:
+                    st.error("Could not queue the report job. Please try again.")
+                else:
+                    st.session_state['report_job'] = report_job_id
+                    st.query_params['report_job'] = str(report_job_id)
+                    # Increment Usage Counter
+                    st.session_state['report_gen_count'] += 1
+        
+        @st.fragment(run_every=2)
+        def show_report_job(job_id):
+            job = job_utils.get_job(job_id)
+            if job is not None and job['status'] in job_utils.ACTIVE_STATUSES:
+                if job['status'] == 'queued':
+                    st.info("⏳ Report queued, waiting for a worker...")
+                else:
+                    st.info(f"⏳ {job['progress_message'] or 'Generating insights...'}")
+                    partial = (job['result'] or {}).get('report')
+                    if partial:
+                        st.markdown(partial + "▌")
+                return
             
+            st.session_state.pop('report_job', None)
+            st.query_params.pop('report_job', None)
+            if job is None or job['status'] == 'failed':
+                error = job['error'] if job else "Report job not found."
+                st.session_state['generated_report'] = f"Error during generation: {error}"
+                st.session_state.pop('report_metadata', None)
+            else:
+                st.session_state['generated_report'] = job['result']['report']
+                st.session_state['report_metadata'] = job['result']['metadata']
             # Rerun to update the display with the new report
             st.rerun()
+        
+        if report_job_id:
+            with status_area.container():
+                show_report_job(int(report_job_id))
     else:
         st.info("No reviews found to analyze.")
 
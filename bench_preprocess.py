@@ -0,0 +1,114 @@
+"""
+Benchmark the OCR preprocessing stage (image_utils) against the raw upload path.
+
+Offline: bytes uploaded, estimated request tokens and preprocessing time
+(serial vs process pool) for every image in uploads/.
+With --extract N: also sends N images to Gemini both ways and compares
+latency and the extracted fields (needs GOOGLE_API_KEY).
+
+Usage:
+    python bench_preprocess.py
+    python bench_preprocess.py --extract 10
+"""
+import os
+import io
+import time
+import argparse
+import difflib
+import concurrent.futures
+import multiprocessing
+from PIL import Image
+import image_utils
+import ocr_utils
+import config_utils
+
+UPLOAD_DIR = "uploads"
+COMPARE_FIELDS = ['user_name', 'review_date', 'rating_overall', 'rating_taste', 'rating_env', 'rating_service', 'rating_value']
+
+def load_images(directory, limit=None):
+    names = sorted(n for n in os.listdir(directory) if n.lower().endswith(('.png', '.jpg', '.jpeg')))
+    if limit:
+        names = names[:limit]
+    images = []
+    for name in names:
+        with open(os.path.join(directory, name), "rb") as f:
+            images.append((name, f.read()))
+    return images
+
+def raw_tokens(image_bytes):
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        return ocr_utils.estimate_request_tokens(*img.size)
+
+def bench_offline(images, max_dim, fmt, quality):
+    start = time.perf_counter()
+    results = [image_utils.preprocess_image(data, max_dim, fmt, quality) for _, data in images]
+    serial = time.perf_counter() - start
+
+    start = time.perf_counter()
+    # Same start method as image_utils.get_process_pool()
+    with concurrent.futures.ProcessPoolExecutor(mp_context=multiprocessing.get_context("spawn")) as pool:
+        list(pool.map(image_utils.preprocess_image, [data for _, data in images],
+                      [max_dim] * len(images), [fmt] * len(images), [quality] * len(images)))
+    pooled = time.perf_counter() - start
+
+    raw_bytes = sum(len(data) for _, data in images)
+    new_bytes = sum(r['bytes'] for r in results)
+    before_tokens = sum(raw_tokens(data) for _, data in images)
+    after_tokens = sum(ocr_utils.estimate_request_tokens(r['width'], r['height']) for r in results)
+
+    print(f"Images: {len(images)} (max_dim={max_dim}, format={fmt}, quality={quality})")
+    print(f"Bytes uploaded: {raw_bytes / 1e6:.1f} MB raw -> {new_bytes / 1e6:.1f} MB preprocessed "
+          f"({1 - new_bytes / raw_bytes:.0%} less)")
+    print(f"Estimated request tokens: {before_tokens} -> {after_tokens} ({1 - after_tokens / before_tokens:.0%} less)")
+    print(f"Preprocessing time: {serial:.2f}s serial, {pooled:.2f}s in a {os.cpu_count()}-process pool "
+          f"({serial / len(images) * 1000:.0f} ms/image serial)")
+
+def _timed_extract(image):
+    start = time.perf_counter()
+    data = ocr_utils.extract_review_data(image)
+    return data, time.perf_counter() - start
+
+def bench_extract(images, max_dim, fmt, quality):
+    raw_latency = []
+    new_latency = []
+    field_matches = 0
+    field_total = 0
+    content_ratios = []
+    for name, data in images:
+        with Image.open(io.BytesIO(data)) as img:
+            img.load()
+        raw, raw_time = _timed_extract(img)
+        processed = image_utils.preprocess_image(data, max_dim, fmt, quality)
+        new, new_time = _timed_extract({'mime_type': processed['mime_type'], 'data': processed['data']})
+        raw_latency.append(raw_time)
+        new_latency.append(new_time)
+
+        if "error" in raw or "error" in new:
+            print(f"  {name}: error (raw: {raw.get('error')}, preprocessed: {new.get('error')})")
+            continue
+        matches = sum(str(raw.get(f)) == str(new.get(f)) for f in COMPARE_FIELDS)
+        ratio = difflib.SequenceMatcher(None, raw.get('content') or '', new.get('content') or '').ratio()
+        field_matches += matches
+        field_total += len(COMPARE_FIELDS)
+        content_ratios.append(ratio)
+        print(f"  {name}: {raw_time:.1f}s -> {new_time:.1f}s, fields {matches}/{len(COMPARE_FIELDS)}, content similarity {ratio:.2f}")
+
+    print(f"Mean latency: {sum(raw_latency) / len(raw_latency):.2f}s raw -> {sum(new_latency) / len(new_latency):.2f}s preprocessed")
+    if field_total:
+        print(f"Field agreement with raw extraction: {field_matches / field_total:.0%}, "
+              f"mean content similarity {sum(content_ratios) / len(content_ratios):.2f}")
+
+if __name__ == "__main__":
+    config_utils.load_secrets_into_env()
+
+    parser = argparse.ArgumentParser(description="Benchmark OCR image preprocessing.")
+    parser.add_argument("--dir", default=UPLOAD_DIR, help="Directory of screenshots.")
+    parser.add_argument("--max-dim", type=int, default=image_utils.DEFAULT_MAX_DIM)
+    parser.add_argument("--format", default=image_utils.DEFAULT_FORMAT, choices=sorted(image_utils.MIME_TYPES))
+    parser.add_argument("--quality", type=int, default=image_utils.DEFAULT_QUALITY)
+    parser.add_argument("--extract", type=int, default=0, help="Also compare Gemini extractions on this many images.")
+    args = parser.parse_args()
+
+    bench_offline(load_images(args.dir), args.max_dim, args.format, args.quality)
+    if args.extract:
+        bench_extract(load_images(args.dir, args.extract), args.max_dim, args.format, args.quality)
@@ -0,0 +1,112 @@
+import os
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from config_utils import get_setting
+
+CACHE_DIR = ".cache"
+EXTRACTION_CACHE_PATH = os.path.join(CACHE_DIR, "extractions.sqlite3")
+# Least recently used entries are evicted once the cache grows past this
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+
+class ExtractionCache:
+    """
+    Persistent key -> JSON cache for OCR extraction results, stored in SQLite.
+    Keys are built by the caller (image hash + prompt/model version).
+    Evicts least recently used entries when the stored size exceeds max_bytes.
+    """
+
+    def __init__(self, path=EXTRACTION_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS extractions (
+                    key TEXT PRIMARY KEY,
+                    result TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_extractions_last_used ON extractions (last_used)")
+
+    @contextmanager
+    def _connect(self):
+        # One short-lived connection per call keeps this safe across threads
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key):
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT result FROM extractions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute("UPDATE extractions SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.hits += 1
+            return json.loads(row[0])
+
+    def contains(self, key):
+        """Checks for an entry without counting a hit or miss."""
+        with self._lock, self._connect() as conn:
+            return conn.execute("SELECT 1 FROM extractions WHERE key = ?", (key,)).fetchone() is not None
+
+    def put(self, key, result):
+        payload = json.dumps(result, ensure_ascii=False)
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO extractions (key, result, size, created_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, payload, len(payload.encode("utf-8")), now, now)
+            )
+            self._evict(conn)
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM extractions").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Walk from least recently used until we are back under the limit
+        to_delete = []
+        for key, size in conn.execute("SELECT key, size FROM extractions ORDER BY last_used"):
+            if total <= self.max_bytes:
+                break
+            to_delete.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM extractions WHERE key = ?", to_delete)
+
+    def stats(self):
+        """Returns hit/miss counters for this process plus the stored entry count and size."""
+        with self._lock, self._connect() as conn:
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM extractions").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': entries,
+            'bytes': size,
+        }
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_extraction_cache():
+    """Returns the process-wide extraction cache (max size from EXTRACTION_CACHE_MAX_MB)."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            max_mb = get_setting("EXTRACTION_CACHE_MAX_MB")
+            max_bytes = int(float(max_mb) * 1024 * 1024) if max_mb else DEFAULT_MAX_BYTES
+            _cache = ExtractionCache(max_bytes=max_bytes)
+        return _cache
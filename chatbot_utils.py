@@ -1,26 +1,12 @@
-import google.generativeai as genai
-import streamlit as st
 import pandas as pd
-import os
 import json
+import llm_utils
 
-def configure_genai():
-    """Configures the Gemini API key from Streamlit secrets or environment variables."""
-    try:
-        api_key = st.secrets["GOOGLE_API_KEY"]
-    except (FileNotFoundError, KeyError):
-        api_key = os.getenv("GOOGLE_API_KEY")
-    
-    if not api_key:
-        return False
-    
-    genai.configure(api_key=api_key)
-    return True
-
-def get_data_context(df):
+def get_data_context(df, sample_df=None):
     """
     Generates a concise summary of the dataframe for the LLM.
     Includes column names, date range, and a sample of recent reviews.
+    sample_df optionally supplies the sample rows (e.g. when df has no text columns).
     """
     if df is None or df.empty:
         return "No underlying data available."
@@ -43,15 +29,16 @@ def get_data_context(df):
         
     # Add a sample of reviews (latest 5)
     buffer.append("\nSAMPLE REVIEWS (LATEST 5):")
+    sample_source = sample_df if sample_df is not None and not sample_df.empty else df
     # Ensure sorted by date if possible
-    if 'review_date' in df.columns:
-        df_sorted = df.sort_values('review_date', ascending=False)
+    if 'review_date' in sample_source.columns:
+        df_sorted = sample_source.sort_values('review_date', ascending=False)
     else:
-        df_sorted = df
+        df_sorted = sample_source
         
     # Select relevant columns for context
     cols_to_show = ['user_name', 'review_date', 'rating_overall', 'content']
-    cols_to_show = [c for c in cols_to_show if c in df.columns]
+    cols_to_show = [c for c in cols_to_show if c in sample_source.columns]
     
     sample_records = df_sorted.head(5)[cols_to_show].to_dict(orient='records')
     buffer.append(json.dumps(sample_records, indent=2, default=str))
@@ -91,9 +78,8 @@ def chat_stream(messages, report_context="", data_context=""):
     5. Be professional, concise, and helpful.
     """
     
-    # Configure Model
-    # Using 'gemini-3-flash-preview' as per project standard
-    model = genai.GenerativeModel('gemini-3-flash-preview', system_instruction=system_prompt)
+    # Shared, cached model handle (project-standard model)
+    model = llm_utils.get_model(llm_utils.DEFAULT_MODEL, system_instruction=system_prompt)
     
     # Convert messages to Gemini format
     history = []
@@ -0,0 +1,27 @@
+import os
+import streamlit as st
+
+SECRETS_PATH = os.path.join(".streamlit", "secrets.toml")
+
+def get_setting(name, default=None):
+    """Reads a setting from Streamlit secrets, falling back to environment variables."""
+    try:
+        return st.secrets[name]
+    except (FileNotFoundError, KeyError):
+        return os.getenv(name, default)
+
+def load_secrets_into_env(path=SECRETS_PATH):
+    """
+    For command-line tools run outside Streamlit: copies the top-level values
+    of secrets.toml into os.environ, so get_setting() and libraries that read
+    the environment find them. Prints a note if the file can't be read.
+    """
+    try:
+        import toml
+        secrets = toml.load(path)
+    except Exception as e:
+        print(f"Could not load secrets: {e}")
+        return
+    for name, value in secrets.items():
+        if not isinstance(value, dict):
+            os.environ[name] = str(value)
@@ -1,104 +1,840 @@
+import hashlib
+import unicodedata
 import psycopg2
+import psycopg2.extras
+import psycopg2.pool
+from psycopg2 import sql
 import streamlit as st
 import os
+import datetime
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from collections import deque
 import pandas as pd
+import snapshot_utils
+from config_utils import get_setting
+
+# Pool sizing defaults (override with DB_POOL_MIN / DB_POOL_MAX in secrets or env)
+DEFAULT_POOL_MIN = 1
+DEFAULT_POOL_MAX = 5
+# Seconds to wait for a free connection before giving up
+POOL_CHECKOUT_TIMEOUT = 30
+# Neon can take a few seconds to wake up after scaling to zero
+RECONNECT_ATTEMPTS = 3
+RECONNECT_BACKOFF = 1.0
+
+def _get_dsn():
+    dsn = get_setting("NEON_DB_CONNECTION_STRING")
+    if not dsn:
+        raise ValueError("Database connection string not found.")
+    return dsn
 
 def get_db_connection():
     """Establishes a connection to the Neon Postgres database."""
-    try:
-        # Try getting from Streamlit secrets first
-        dsn = st.secrets["NEON_DB_CONNECTION_STRING"]
-        conn = psycopg2.connect(dsn)
+    return psycopg2.connect(_get_dsn())
+
+class _CountingPool(psycopg2.pool.ThreadedConnectionPool):
+    """ThreadedConnectionPool that counts how many physical connections it opens."""
+
+    def __init__(self, minconn, maxconn, *args, **kwargs):
+        self.connections_created = 0
+        super().__init__(minconn, maxconn, *args, **kwargs)
+
+    def _connect(self, key=None):
+        conn = super()._connect(key)
+        self.connections_created += 1
         return conn
-    except (FileNotFoundError, KeyError):
-        # Fallback to environment variable
-        dsn = os.getenv("NEON_DB_CONNECTION_STRING")
-        if dsn:
-            conn = psycopg2.connect(dsn)
-            return conn
-        else:
-            raise ValueError("Database connection string not found.")
+
+class ConnectionPool:
+    """
+    Process-wide Postgres connection pool.
+    Blocks (up to a timeout) when all connections are busy, health-checks
+    connections on checkout and transparently replaces ones that were dropped,
+    e.g. after Neon scaled the compute to zero.
+    """
+
+    def __init__(self, dsn, minconn=DEFAULT_POOL_MIN, maxconn=DEFAULT_POOL_MAX):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        # Keepalives let us notice dead TLS sessions instead of hanging on them
+        self._pool = _CountingPool(
+            minconn, maxconn, dsn,
+            keepalives=1, keepalives_idle=30, keepalives_interval=10, keepalives_count=3,
+        )
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._stats_lock = threading.Lock()
+        self._checkouts = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+        self._reconnects = 0
+
+    def getconn(self, timeout=POOL_CHECKOUT_TIMEOUT):
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=timeout):
+            raise psycopg2.pool.PoolError(f"No database connection available after {timeout}s")
+        waited = time.perf_counter() - start
+        try:
+            conn = self._checkout_healthy()
+        except Exception:
+            self._slots.release()
+            raise
+        with self._stats_lock:
+            self._checkouts += 1
+            self._wait_time_total += waited
+            self._wait_time_max = max(self._wait_time_max, waited)
+        return conn
+
+    def _checkout_healthy(self):
+        # Only failed connects count as attempts: after Neon scales to zero every
+        # idle connection in the pool is dead, and discarding them says nothing
+        # about whether the server is reachable.
+        last_error = None
+        failures = 0
+        while failures < RECONNECT_ATTEMPTS:
+            created = self._pool.connections_created
+            try:
+                conn = self._pool.getconn()
+            except psycopg2.OperationalError as e:
+                # Server unreachable (usually still waking up) - back off and retry
+                last_error = e
+            else:
+                if self._is_healthy(conn):
+                    return conn
+                # Stale connection: drop it so the pool opens a fresh one next time
+                self._pool.putconn(conn, close=True)
+                with self._stats_lock:
+                    self._reconnects += 1
+                if self._pool.connections_created == created:
+                    # It was an idle one; try the next without using up an attempt
+                    continue
+                last_error = psycopg2.OperationalError("New connection failed its health check")
+            failures += 1
+            if failures < RECONNECT_ATTEMPTS:
+                time.sleep(RECONNECT_BACKOFF * (2 ** (failures - 1)))
+        raise psycopg2.OperationalError(f"Could not obtain a healthy database connection: {last_error}")
+
+    @staticmethod
+    def _is_healthy(conn):
+        if conn.closed:
+            return False
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            return False
+
+    def putconn(self, conn):
+        try:
+            if conn.closed:
+                self._pool.putconn(conn, close=True)
+            else:
+                # Never hand out a connection with an open transaction
+                conn.rollback()
+                self._pool.putconn(conn)
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            self._pool.putconn(conn, close=True)
+        finally:
+            self._slots.release()
+
+    def stats(self):
+        """Returns counters for monitoring pool behaviour."""
+        with self._stats_lock:
+            return {
+                'min_size': self.minconn,
+                'max_size': self.maxconn,
+                'connections_created': self._pool.connections_created,
+                'reconnects': self._reconnects,
+                'checkouts': self._checkouts,
+                'wait_time_total': self._wait_time_total,
+                'wait_time_max': self._wait_time_max,
+                'wait_time_avg': self._wait_time_total / self._checkouts if self._checkouts else 0.0,
+            }
+
+@st.cache_resource
+def get_pool():
+    """Returns the connection pool shared by all sessions in this process."""
+    minconn = int(get_setting("DB_POOL_MIN", DEFAULT_POOL_MIN))
+    maxconn = int(get_setting("DB_POOL_MAX", DEFAULT_POOL_MAX))
+    return ConnectionPool(_get_dsn(), minconn=minconn, maxconn=maxconn)
+
+@contextmanager
+def get_conn():
+    """Borrows a connection from the pool and returns it when the block exits."""
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        pool.putconn(conn)
+
+def get_pool_stats():
+    """Returns wait-time and connection counters for the shared pool."""
+    return get_pool().stats()
+
+def _normalize_text(value):
+    """Collapses whitespace and case so trivially different OCR output hashes the same."""
+    if value is None:
+        return ""
+    text = unicodedata.normalize("NFKC", str(value))
+    return " ".join(text.split()).lower()
+
+def compute_content_hash(user_name, content):
+    """Returns the dedup key (hex SHA-256) for a review's user_name and content."""
+    key = _normalize_text(user_name) + "\x1f" + _normalize_text(content)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
 
 def init_db():
-    """Initializes the database with the schema."""
-    conn = get_db_connection()
+    """Initializes the database by applying any pending migrations (see migrations.py)."""
+    # Imported here because migrations.py itself imports db_utils
+    import migrations
     try:
-        cur = conn.cursor()
-        with open('schema.sql', 'r') as f:
-            schema = f.read()
-        cur.execute(schema)
-        conn.commit()
-        cur.close()
+        return migrations.migrate()
     except Exception as e:
         print(f"Error initializing DB: {e}")
-        conn.rollback()
-    finally:
-        conn.close()
+        return False
+
+def get_schema_version():
+    """Returns the newest schema version recorded in the database (None if never bootstrapped)."""
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT to_regclass('schema_version') IS NOT NULL")
+        if not cur.fetchone()[0]:
+            cur.close()
+            return None
+        cur.execute("SELECT MAX(version) FROM schema_version")
+        version = cur.fetchone()[0]
+        cur.close()
+        return version
+
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+def bootstrap_schema():
+    """
+    Makes sure the schema is in place, once per server process.
+    After the first successful call this returns without touching the database;
+    migrations only run when the recorded version is behind migrations.LATEST_VERSION.
+    """
+    import migrations
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if _schema_ready:
+            return
+        try:
+            current = get_schema_version()
+        except Exception as e:
+            print(f"Error reading schema version: {e}")
+            return
+        if current is not None and current >= migrations.LATEST_VERSION:
+            _schema_ready = True
+        elif init_db():
+            _schema_ready = True
+
+_schema_thread_lock = threading.Lock()
+_schema_thread = None
+
+def start_schema_bootstrap():
+    """
+    Runs bootstrap_schema() on a background thread and returns at once, so the
+    app can render (e.g. the Analysis tab from the local snapshot) while Neon
+    wakes up. A failed attempt is retried on the next call.
+    """
+    global _schema_thread
+    if _schema_ready:
+        return
+    with _schema_thread_lock:
+        if _schema_thread is None or not _schema_thread.is_alive():
+            _schema_thread = threading.Thread(target=bootstrap_schema, daemon=True)
+            _schema_thread.start()
 
 def check_duplicate(user_name, content):
     """Checks if a review already exists to prevent duplicates."""
-    conn = get_db_connection()
     exists = False
-    try:
-        cur = conn.cursor()
-        query = "SELECT id FROM reviews WHERE user_name = %s AND content = %s"
-        cur.execute(query, (user_name, content))
-        if cur.fetchone():
-            exists = True
-        cur.close()
-    except Exception as e:
-        print(f"Error checking duplicate: {e}")
-    finally:
-        conn.close()
+    with get_conn() as conn:
+        try:
+            cur = conn.cursor()
+            query = "SELECT id FROM reviews WHERE content_hash = %s"
+            cur.execute(query, (compute_content_hash(user_name, content),))
+            if cur.fetchone():
+                exists = True
+            cur.close()
+        except Exception as e:
+            print(f"Error checking duplicate: {e}")
     return exists
 
 def insert_review(data):
     """Inserts a new review into the database."""
-    conn = get_db_connection()
+    with get_conn() as conn:
+        try:
+            cur = conn.cursor()
+            # review_id and review_year have defaults, so we don't need to insert them explicitly unless we want to override.
+            query = """
+                INSERT INTO reviews (user_name, review_date, rating_overall, rating_taste, rating_env, rating_service, rating_value, content, image_path, source_filename, content_hash)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """
+            # Handle date parsing or cleaning if necessary in app.py before calling this
+            cur.execute(query, (
+                data.get('user_name'),
+                data.get('review_date'),
+                data.get('rating_overall'),
+                data.get('rating_taste'),
+                data.get('rating_env'),
+                data.get('rating_service'),
+                data.get('rating_value'),
+                data.get('content'),
+                data.get('image_path'),
+                data.get('source_filename'),
+                compute_content_hash(data.get('user_name'), data.get('content'))
+            ))
+            conn.commit()
+            cur.close()
+            return True
+        except Exception as e:
+            print(f"Error inserting review: {e}")
+            conn.rollback()
+            return False
+
+# Columns written by the ingestion path, in insert order
+INSERT_COLUMNS = ['user_name', 'review_date', 'rating_overall', 'rating_taste', 'rating_env', 'rating_service', 'rating_value', 'content', 'image_path', 'source_filename', 'content_hash']
+
+def insert_reviews_bulk(records):
+    """
+    Inserts a batch of reviews in a single transaction and round-trip.
+    Rows whose content hash matches an existing review, or an earlier row in
+    the same batch, are skipped.
+    records: list of dicts, or a normalize_utils.ReviewBatch.
+    Returns (inserted, skipped) lists of the input records (plain dicts for a
+    ReviewBatch), or None if the insert failed and was rolled back.
+    """
+    if hasattr(records, 'to_records'):
+        records = records.to_records()
+    if not records:
+        return [], []
+    # The app only starts the bootstrap in the background; make sure it has run
+    bootstrap_schema()
+
+    # In-batch duplicates never reach the database
+    unique_records = []
+    hashes = []
+    skipped = []
+    seen = set()
+    for data in records:
+        content_hash = compute_content_hash(data.get('user_name'), data.get('content'))
+        if content_hash in seen:
+            skipped.append(data)
+        else:
+            seen.add(content_hash)
+            unique_records.append(data)
+            hashes.append(content_hash)
+
+    columns = ", ".join(INSERT_COLUMNS)
+    query = f"""
+        INSERT INTO reviews ({columns})
+        VALUES %s
+        ON CONFLICT (content_hash) DO NOTHING
+        RETURNING content_hash
+    """
+    # Explicit casts so NULLs in the first row don't decide the VALUES column types
+    template = "(%s, %s::date, %s::float, %s::float, %s::float, %s::float, %s::float, %s, %s, %s, %s)"
+    rows = [
+        tuple(data.get(c) for c in INSERT_COLUMNS[:-1]) + (content_hash,)
+        for data, content_hash in zip(unique_records, hashes)
+    ]
+
     try:
+        with get_conn() as conn:
+            try:
+                cur = conn.cursor()
+                # page_size covers the whole batch so it goes out as one statement
+                returned = psycopg2.extras.execute_values(cur, query, rows, template=template, page_size=len(rows), fetch=True)
+                conn.commit()
+                cur.close()
+            except Exception:
+                conn.rollback()
+                raise
+    except Exception as e:
+        # Also covers an unreachable database (get_conn failing)
+        print(f"Error bulk inserting reviews: {e}")
+        return None
+
+    inserted_hashes = {row[0] for row in returned}
+    inserted = []
+    for data, content_hash in zip(unique_records, hashes):
+        if content_hash in inserted_hashes:
+            inserted.append(data)
+        else:
+            skipped.append(data)
+    return inserted, skipped
+
+
+
+# Minimum seconds between delta refreshes of the cached reviews table
+REVIEWS_REFRESH_INTERVAL = 60
+# Re-read this much history on each delta so rows from transactions that
+# committed late (with an older timestamp) are not missed
+REVIEWS_REFRESH_OVERLAP = datetime.timedelta(seconds=60)
+# Deltas remembered for get_review_changes(); consumers further behind reload everything
+REVIEW_CHANGES_KEPT = 50
+
+class _ReviewCache:
+    """
+    Process-wide copy of the reviews table (CACHED_COLUMNS only) plus the
+    high-water marks used for delta refreshes.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.df = None
+        self.max_id = 0
+        self.max_updated_at = None
+        self.max_deleted_at = None
+        self.last_refresh = 0.0
+        # Set while a background refresh is catching a snapshot up with the DB
+        self.refreshing = False
+        # Bumped on every change to df; changes holds (generation, dropped ids, added rows)
+        # for the most recent deltas. A full load or snapshot starts a new history.
+        self.generation = 0
+        self.changes = deque(maxlen=REVIEW_CHANGES_KEPT)
+
+    def load_full(self, conn):
+        self.df = pd.read_sql_query(f"SELECT {', '.join(CACHED_COLUMNS)} FROM reviews ORDER BY id DESC", conn)
+        self.max_id = 0
+        self.max_updated_at = None
+        self._advance_marks(self.df)
+        # Tombstones older than the full load are already reflected in it
         cur = conn.cursor()
-        # review_id and review_year have defaults, so we don't need to insert them explicitly unless we want to override.
-        query = """
-            INSERT INTO reviews (user_name, review_date, rating_overall, rating_taste, rating_env, rating_service, rating_value, content, image_path, source_filename)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """
-        # Handle date parsing or cleaning if necessary in app.py before calling this
-        cur.execute(query, (
-            data.get('user_name'), 
-            data.get('review_date'), 
-            data.get('rating_overall'),
-            data.get('rating_taste'),
-            data.get('rating_env'),
-            data.get('rating_service'),
-            data.get('rating_value'),
-            data.get('content'),
-            data.get('image_path'),
-            data.get('source_filename')
-        ))
-        conn.commit()
+        cur.execute("SELECT MAX(deleted_at) FROM review_tombstones")
+        self.max_deleted_at = cur.fetchone()[0]
         cur.close()
+        self._reset_changes()
+        self.last_refresh = time.monotonic()
         return True
-    except Exception as e:
-        print(f"Error inserting review: {e}")
-        conn.rollback()
-        return False
-    finally:
-        conn.close()
 
+    def load_delta(self, conn):
+        """Merges rows changed since the high-water marks; returns True if anything changed."""
+        since = self.max_updated_at - REVIEWS_REFRESH_OVERLAP if self.max_updated_at is not None else datetime.datetime.min
+        changed = pd.read_sql_query(
+            f"SELECT {', '.join(CACHED_COLUMNS)} FROM reviews WHERE id > %(max_id)s OR updated_at > %(since)s",
+            conn, params={'max_id': int(self.max_id), 'since': since}
+        )
+        deleted_since = self.max_deleted_at - REVIEWS_REFRESH_OVERLAP if self.max_deleted_at is not None else datetime.datetime.min
+        cur = conn.cursor()
+        cur.execute("SELECT review_id, deleted_at FROM review_tombstones WHERE deleted_at > %s", (deleted_since,))
+        tombstones = cur.fetchall()
+        cur.close()
+
+        # The overlap window always re-reads the newest rows; only keep the ones
+        # that are new or whose updated_at differs from the cached copy
+        if not changed.empty and not self.df.empty:
+            cached = changed['id'].map(self.df.set_index('id')['updated_at'])
+            changed = changed[cached.isna() | (cached != changed['updated_at'])]
+        cached_ids = set(self.df['id']) if tombstones else set()
+        tombstones = [(review_id, deleted_at) for review_id, deleted_at in tombstones if review_id in cached_ids]
+
+        drop_ids = set(changed['id']) | {review_id for review_id, _ in tombstones}
+        if drop_ids:
+            df = self.df[~self.df['id'].isin(drop_ids)]
+            if not changed.empty:
+                # Edited rows come back in full; deleted ones are dropped below
+                changed = changed[~changed['id'].isin({review_id for review_id, _ in tombstones})]
+                df = pd.concat([changed, df], ignore_index=True) if not df.empty else changed
+            self.df = df.sort_values('id', ascending=False, ignore_index=True)
+            # Edited rows are dropped and re-added, so replaying a delta twice is harmless
+            self.changes.append((self.generation + 1, drop_ids, changed))
+            self.generation += 1
+
+        self._advance_marks(changed)
+        if tombstones:
+            latest = max(deleted_at for _, deleted_at in tombstones)
+            if self.max_deleted_at is None or latest > self.max_deleted_at:
+                self.max_deleted_at = latest
+
+        # Deltas never see a TRUNCATE or a restore from backup (no tombstones,
+        # older updated_at); if the table no longer matches the cache, reload it
+        cur = conn.cursor()
+        cur.execute("SELECT COUNT(*), COALESCE(MAX(id), 0) FROM reviews")
+        db_count, db_max_id = cur.fetchone()
+        cur.close()
+        cached_max_id = int(self.df['id'].max()) if not self.df.empty else 0
+        if db_count != len(self.df) or db_max_id != cached_max_id:
+            print(f"Reviews table no longer matches the cache ({db_count} rows in DB, {len(self.df)} cached); reloading")
+            return self.load_full(conn)
+        self.last_refresh = time.monotonic()
+        return bool(drop_ids)
+
+    def _stamp(self):
+        import migrations
+        return {
+            'schema_version': migrations.LATEST_VERSION,
+            'max_id': self.max_id,
+            'max_updated_at': self.max_updated_at,
+            'max_deleted_at': self.max_deleted_at,
+        }
+
+    def load_snapshot(self):
+        """Seeds the cache from the on-disk snapshot; returns True if one was usable."""
+        import migrations
+        df, stamp = snapshot_utils.load_snapshot(migrations.LATEST_VERSION)
+        if df is None:
+            return False
+        self.df = df
+        self.max_id = stamp.get('max_id') or 0
+        self.max_updated_at = stamp.get('max_updated_at')
+        self.max_deleted_at = stamp.get('max_deleted_at')
+        self._reset_changes()
+        return True
+
+    def save_snapshot(self):
+        snapshot_utils.save_snapshot(self.df, self._stamp())
+
+    def _reset_changes(self):
+        self.changes.clear()
+        self.generation += 1
+
+    def _advance_marks(self, df):
+        if df.empty:
+            return
+        self.max_id = max(self.max_id, int(df['id'].max()))
+        if 'updated_at' in df.columns and df['updated_at'].notna().any():
+            latest = df['updated_at'].max().to_pydatetime()
+            if self.max_updated_at is None or latest > self.max_updated_at:
+                self.max_updated_at = latest
+
+@st.cache_resource
+def _get_review_cache():
+    return _ReviewCache()
+
+def _refresh_reviews_cache(cache, incremental):
+    """Brings the cache up to date with the DB (caller holds cache.lock)."""
+    with get_conn() as conn:
+        if not incremental or cache.df is None:
+            changed = cache.load_full(conn)
+        else:
+            changed = cache.load_delta(conn)
+    if changed:
+        cache.save_snapshot()
+
+def _background_refresh(cache):
+    with cache.lock:
+        try:
+            _refresh_reviews_cache(cache, incremental=True)
+        except Exception as e:
+            print(f"Error refreshing reviews snapshot: {e}")
+        finally:
+            cache.refreshing = False
+
+def get_all_reviews(incremental=True, columns=None):
+    """
+    Fetches all reviews for the dashboard (CACHED_COLUMNS; use get_reviews() for text).
+    The table is cached per process; after the first load only rows inserted,
+    edited or deleted since the last refresh are fetched and merged in.
+    On a cold start the cache is seeded from the local snapshot (see
+    snapshot_utils) and caught up with the DB in the background.
+    Pass incremental=False to force a full reload; columns limits the copy returned.
+    """
+    cache = _get_review_cache()
+    if not _ensure_fresh(cache, incremental):
+        return pd.DataFrame()
+
+    # Callers add/convert columns in place, so never hand out the cached frame
+    df = cache.df
+    if columns is not None:
+        return df[[c for c in columns if c in df.columns]].copy()
+    return df.copy()
+
+def _ensure_fresh(cache, incremental=True):
+    """Loads or refreshes the cache as get_all_reviews() describes; False if nothing could be loaded."""
+    if incremental and cache.df is None:
+        with cache.lock:
+            if cache.df is None and cache.load_snapshot():
+                # Serve from local disk right away while the DB wakes up
+                cache.refreshing = True
+                threading.Thread(target=_background_refresh, args=(cache,), daemon=True).start()
+
+    fresh = time.monotonic() - cache.last_refresh < REVIEWS_REFRESH_INTERVAL
+    if not (incremental and cache.df is not None and (cache.refreshing or fresh)):
+        with cache.lock:
+            try:
+                if not incremental or cache.df is None or time.monotonic() - cache.last_refresh >= REVIEWS_REFRESH_INTERVAL:
+                    _refresh_reviews_cache(cache, incremental)
+            except Exception as e:
+                print(f"Error fetching reviews: {e}")
+    return cache.df is not None
+
+def get_reviews_version():
+    """
+    A key that changes whenever the cached reviews change: (max id, row count,
+    last update, last delete). Lets callers memoize work derived from
+    get_all_reviews() without copying or hashing the table. None if nothing is loaded.
+    """
+    cache = _get_review_cache()
+    if not _ensure_fresh(cache):
+        return None
+    # No lock: a background refresh holds it for the whole DB round trip. A torn
+    # read only produces a key that doesn't match, i.e. one extra recompute.
+    return (cache.max_id, len(cache.df), cache.max_updated_at, cache.max_deleted_at)
+
+def get_review_changes(since_generation):
+    """
+    Rows changed in the reviews cache since since_generation, for callers that
+    maintain their own derived state incrementally.
+    Returns (generation, changes): changes is a list of (ids to drop, DataFrame of
+    rows to add) to apply in order, or None if the history doesn't reach back
+    that far (or since_generation is None) and the caller should rebuild from
+    get_all_reviews(). Read generation before loading, then pass it back next time.
+    """
+    cache = _get_review_cache()
+    # No lock, as in get_reviews_version(): a delta seen early is simply applied again
+    generation = cache.generation
+    if since_generation == generation:
+        return generation, []
+    pending = [change for change in list(cache.changes) if change[0] > (since_generation or 0)]
+    if since_generation is None or not pending or pending[0][0] != since_generation + 1:
+        return generation, None
+    return generation, [(ids, added) for _, ids, added in pending]
 
+def invalidate_reviews_cache():
+    """Makes the next get_all_reviews() call fetch the latest changes immediately and drops cached counts."""
+    _get_review_cache().last_refresh = 0.0
+    _count_reviews.clear()
+
+# Every column of the reviews table that callers may project
+REVIEW_COLUMNS = [
+    'id', 'user_name', 'review_date', 'rating_overall', 'rating_taste', 'rating_env',
+    'rating_service', 'rating_value', 'content', 'review_year', 'source', 'image_path',
+    'source_filename', 'created_at', 'content_hash', 'updated_at',
+]
+# Column sets used by the app
+DISPLAY_COLUMNS = ['id', 'user_name', 'review_date', 'rating_overall', 'rating_taste', 'rating_env', 'rating_service', 'rating_value', 'content', 'source_filename']
+ANALYSIS_COLUMNS = ['id', 'review_date', 'rating_overall', 'rating_taste', 'rating_env', 'rating_service', 'rating_value']
+# What the full-history cache (and its snapshot) holds: the Analysis tab's columns plus the delta mark
+CACHED_COLUMNS = ANALYSIS_COLUMNS + ['updated_at']
+REPORT_COLUMNS = ['user_name', 'rating_overall', 'content', 'review_date']
+
+def _check_columns(columns):
+    columns = list(columns) if columns else REVIEW_COLUMNS
+    unknown = [c for c in columns if c not in REVIEW_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown review columns: {unknown}")
+    return columns
+
+def _select_columns(columns):
+    return sql.SQL("SELECT {columns} FROM reviews").format(
+        columns=sql.SQL(", ").join(sql.Identifier(c) for c in columns)
+    )
+
+def _review_filters(filters):
+    """
+    Builds WHERE conditions for a filters dict.
+    Supported keys: start, end (inclusive review_date bounds), min_rating,
+    max_rating (rating_overall), user_name and text (case-insensitive substring
+    of user_name / content).
+    """
+    conditions = []
+    params = {}
+    filters = filters or {}
+    if filters.get('start') is not None:
+        conditions.append(sql.SQL("review_date >= %(start)s"))
+        params['start'] = filters['start']
+    if filters.get('end') is not None:
+        conditions.append(sql.SQL("review_date <= %(end)s"))
+        params['end'] = filters['end']
+    if filters.get('min_rating') is not None:
+        conditions.append(sql.SQL("rating_overall >= %(min_rating)s"))
+        params['min_rating'] = float(filters['min_rating'])
+    if filters.get('max_rating') is not None:
+        conditions.append(sql.SQL("rating_overall <= %(max_rating)s"))
+        params['max_rating'] = float(filters['max_rating'])
+    if filters.get('user_name'):
+        conditions.append(sql.SQL("user_name ILIKE %(user_name)s"))
+        params['user_name'] = f"%{filters['user_name']}%"
+    if filters.get('text'):
+        conditions.append(sql.SQL("content ILIKE %(text)s"))
+        params['text'] = f"%{filters['text']}%"
+    return conditions, params
+
+def _where(conditions):
+    if not conditions:
+        return sql.SQL("")
+    return sql.SQL(" WHERE ") + sql.SQL(" AND ").join(conditions)
 
 @st.cache_data(ttl=300)
-def get_all_reviews():
-    """Fetches all reviews for the dashboard."""
-    conn = get_db_connection()
+def get_reviews(columns=None, start=None, end=None, limit=None, order_by='id', filters=None):
+    """
+    Fetches reviews with filtering, projection and limits done in SQL.
+    columns: subset of REVIEW_COLUMNS (default: all).
+    start / end: inclusive review_date bounds (uses idx_reviews_review_date).
+    filters: optional dict of extra conditions (see _review_filters).
+    order_by: 'id' or 'review_date', newest first.
+    """
+    columns = _check_columns(columns)
+    if order_by not in ('id', 'review_date'):
+        raise ValueError(f"Cannot order reviews by {order_by!r}")
+
+    filters = dict(filters or {})
+    if start is not None:
+        filters['start'] = start
+    if end is not None:
+        filters['end'] = end
+    conditions, params = _review_filters(filters)
+    query = _select_columns(columns) + _where(conditions)
+    if order_by == 'review_date':
+        query += sql.SQL(" ORDER BY review_date DESC NULLS LAST, id DESC")
+    else:
+        query += sql.SQL(" ORDER BY id DESC")
+    if limit is not None:
+        query += sql.SQL(" LIMIT %(limit)s")
+        params['limit'] = int(limit)
+
+    with get_conn() as conn:
+        try:
+            return pd.read_sql_query(query.as_string(conn), conn, params=params or None)
+        except Exception as e:
+            print(f"Error fetching reviews: {e}")
+            return pd.DataFrame(columns=columns)
+
+# Columns the Database tab can sort by; each has an index ending in id
+PAGE_SORT_COLUMNS = ['id', 'review_date', 'rating_overall']
+
+def _cursor_value(value):
+    """Converts a pandas cell to something psycopg2 can bind (None for NULL)."""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if hasattr(value, 'item'):
+        return value.item()
+    return value
+
+def get_reviews_page(columns=None, sort_by='id', descending=True, after=None, filters=None, page_size=20):
+    """
+    Fetches one page of reviews using keyset pagination on (sort_by, id).
+    after: the cursor returned for the previous page (None for the first page).
+    NULL sort values are placed last in both directions.
+    Returns (df, next_cursor); next_cursor is None on the last page.
+    """
+    columns = _check_columns(columns)
+    if sort_by not in PAGE_SORT_COLUMNS:
+        raise ValueError(f"Cannot sort reviews by {sort_by!r}")
+    # The cursor is built from these, so always select them
+    query_columns = columns + [c for c in ('id', sort_by) if c not in columns]
+
+    conditions, params = _review_filters(filters)
+    direction = sql.SQL("DESC" if descending else "ASC")
+    op = sql.SQL("<" if descending else ">")
+    sort_col = sql.Identifier(sort_by)
+    # One extra row tells us whether another page exists
+    limit = int(page_size) + 1
+    if after is not None:
+        after_value, after_id = after
+        params['after_id'] = after_id
+        if after_value is not None:
+            params['after_value'] = after_value
+
+    # Each query is a plain range over the (sort_by, id) index read in one
+    # direction. NULL sort values come last: mixing them into the same
+    # ORDER BY ... NULLS LAST (or OR-ing in IS NULL) would make every page
+    # sort or scan all matching rows.
+    if sort_by == 'id':
+        keyset = [sql.SQL("id {op} %(after_id)s").format(op=op)] if after is not None else []
+        queries = [(keyset, sql.SQL(" ORDER BY id {dir}").format(dir=direction))]
+    else:
+        queries = []
+        if after is None or after_value is not None:
+            keyset = [sql.SQL("{col} IS NOT NULL").format(col=sort_col)]
+            if after is not None:
+                keyset.append(sql.SQL("({col}, id) {op} (%(after_value)s, %(after_id)s)").format(col=sort_col, op=op))
+            queries.append((keyset, sql.SQL(" ORDER BY {col} {dir}, id {dir}").format(col=sort_col, dir=direction)))
+        # Then (or, once the cursor is in the NULLs tail, only) walk the NULL rows by id
+        keyset = [sql.SQL("{col} IS NULL").format(col=sort_col)]
+        if after is not None and after_value is None:
+            keyset.append(sql.SQL("id {op} %(after_id)s").format(op=op))
+        queries.append((keyset, sql.SQL(" ORDER BY id {dir}").format(dir=direction)))
+
+    frames = []
+    fetched = 0
     try:
-        query = "SELECT * FROM reviews ORDER BY id DESC"
-        df = pd.read_sql_query(query, conn)
-        return df
+        with get_conn() as conn:
+            for keyset, order in queries:
+                if fetched >= limit:
+                    break
+                query = _select_columns(query_columns) + _where(conditions + keyset) + order + sql.SQL(" LIMIT %(limit)s")
+                frames.append(pd.read_sql_query(query.as_string(conn), conn, params=dict(params, limit=limit - fetched)))
+                fetched += len(frames[-1])
     except Exception as e:
-        print(f"Error fetching reviews: {e}")
-        return pd.DataFrame()
-    finally:
-        conn.close()
+        # Also covers an unreachable database (get_conn failing)
+        print(f"Error fetching reviews page: {e}")
+        return pd.DataFrame(columns=columns), None
+    frames = [f for f in frames if not f.empty]
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else (frames[0] if frames else pd.DataFrame(columns=query_columns))
 
+    next_cursor = None
+    if len(df) > page_size:
+        df = df.iloc[:page_size]
+        last = df.iloc[-1]
+        next_cursor = (_cursor_value(last[sort_by]), int(last['id']))
+    return df[columns], next_cursor
 
+# Seconds a filtered count is reused; the Database tab reruns on every widget change
+COUNT_CACHE_TTL = 60
+
+@st.cache_data(ttl=COUNT_CACHE_TTL, show_spinner=False)
+def _count_reviews(filters):
+    # Raises on errors, so a failed count is never cached
+    conditions, params = _review_filters(filters)
+    query = sql.SQL("SELECT COUNT(*) FROM reviews") + _where(conditions)
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute(query, params or None)
+        count = cur.fetchone()[0]
+        cur.close()
+        return count
+
+def count_reviews(filters=None):
+    """
+    Counts reviews matching a filters dict (see _review_filters); None if the DB can't be reached.
+    The COUNT(*) scans every matching row, so results are cached per filters
+    for COUNT_CACHE_TTL seconds (cleared by invalidate_reviews_cache()).
+    """
+    try:
+        return _count_reviews(filters or {})
+    except Exception as e:
+        print(f"Error counting reviews: {e}")
+        return None
+
+def export_reviews_csv(columns=None, filters=None):
+    """
+    Exports matching reviews as CSV (with header) using COPY ... TO STDOUT,
+    written chunk by chunk to a temp file on disk rather than built up in memory.
+    Returns that file opened for reading ('rb'); it is already unlinked where
+    the OS allows, so closing it removes it. The caller should close it.
+    Note st.download_button still reads the whole export into memory.
+    """
+    columns = _check_columns(columns)
+    conditions, params = _review_filters(filters)
+    query = _select_columns(columns) + _where(conditions) + sql.SQL(" ORDER BY id DESC")
+
+    fd, path = tempfile.mkstemp(prefix="reviews_export_", suffix=".csv")
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            with get_conn() as conn:
+                cur = conn.cursor()
+                # COPY can't take bind parameters, so inline them safely first
+                select = cur.mogrify(query, params or None).decode('utf-8')
+                cur.copy_expert(f"COPY ({select}) TO STDOUT WITH (FORMAT csv, HEADER true, ENCODING 'UTF8')", out)
+                cur.close()
+        result = open(path, 'rb')
+    except Exception as e:
+        print(f"Error exporting reviews: {e}")
+        os.remove(path)
+        raise
+    try:
+        os.remove(path)
+    except OSError:
+        # Windows can't unlink an open file; it stays in the temp directory
+        pass
+    return result
@@ -0,0 +1,166 @@
+import os
+import io
+import queue
+import multiprocessing
+import threading
+import concurrent.futures
+import numpy as np
+from PIL import Image
+from config_utils import get_setting
+
+# Defaults, overridable with PREPROCESS_* in secrets or env.
+# Off until `python bench_preprocess.py --extract` shows extraction accuracy holds up
+DEFAULT_ENABLED = "false"
+DEFAULT_MAX_DIM = 1600
+DEFAULT_FORMAT = "JPEG"
+DEFAULT_QUALITY = 85
+# Phone status bar (clock, battery) on tall screenshots; carries no review data
+STATUS_BAR_FRACTION = 0.05
+# Rows whose brightness range is within this are treated as blank background
+BLANK_ROW_TOLERANCE = 8
+# Blank runs longer than this (as a fraction of width) are collapsed to it
+MAX_BLANK_GAP_FRACTION = 0.03
+MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+def get_preprocess_settings():
+    """Returns (enabled, max_dim, format, quality) from PREPROCESS_* settings."""
+    enabled = str(get_setting("PREPROCESS_ENABLED", DEFAULT_ENABLED)).lower() not in ("0", "false", "no")
+    fmt = str(get_setting("PREPROCESS_FORMAT", DEFAULT_FORMAT)).upper()
+    if fmt not in MIME_TYPES:
+        fmt = DEFAULT_FORMAT
+    return (
+        enabled,
+        int(get_setting("PREPROCESS_MAX_DIM", DEFAULT_MAX_DIM)),
+        fmt,
+        int(get_setting("PREPROCESS_QUALITY", DEFAULT_QUALITY)),
+    )
+
+def preprocess_signature():
+    """Identifies the current preprocessing settings (part of the extraction cache key), or None if disabled."""
+    enabled, max_dim, fmt, quality = get_preprocess_settings()
+    if not enabled:
+        return None
+    return f"pre1-{max_dim}-{fmt}-{quality}"
+
+def _blank_rows(pixels):
+    return (pixels.max(axis=1) - pixels.min(axis=1)) <= BLANK_ROW_TOLERANCE
+
+def crop_chrome(image):
+    """
+    Removes the status bar from tall phone screenshots, trims blank rows at the
+    top and bottom, and collapses long blank runs in between (e.g. the empty
+    area under a short review). Only rows without any detail are dropped.
+    """
+    width, height = image.size
+    top = int(height * STATUS_BAR_FRACTION) if height >= 1.8 * width else 0
+
+    pixels = np.asarray(image.convert("L"), dtype=np.int16)[top:]
+    blank = _blank_rows(pixels)
+    if blank.all():
+        return image
+
+    max_gap = max(1, int(width * MAX_BLANK_GAP_FRACTION))
+    keep = ~blank
+    # Position of each row within its run of blank rows (0 for content rows)
+    run_start = np.maximum.accumulate(np.where(keep, np.arange(len(keep)), 0))
+    keep |= (np.arange(len(keep)) - run_start) <= max_gap
+
+    content = np.flatnonzero(~blank)
+    keep[:content[0]] = False
+    keep[content[-1] + 1:] = False
+    rows = np.flatnonzero(keep) + top
+
+    if len(rows) == height:
+        return image
+    array = np.asarray(image.convert("RGB"))
+    return Image.fromarray(array[rows])
+
+def preprocess_image(image_bytes, max_dim=DEFAULT_MAX_DIM, fmt=DEFAULT_FORMAT, quality=DEFAULT_QUALITY):
+    """
+    Crops chrome, downscales so the longer side is at most max_dim and re-encodes.
+    Returns a dict with the encoded data, mime_type, width, height and byte sizes.
+    Runs in worker processes, so it only takes and returns plain values.
+    """
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        img = crop_chrome(img.convert("RGB"))
+    if max(img.size) > max_dim:
+        img.thumbnail((max_dim, max_dim), Image.Resampling.LANCZOS)
+
+    out = io.BytesIO()
+    if fmt == "PNG":
+        img.save(out, format=fmt, optimize=True)
+    else:
+        img.save(out, format=fmt, quality=quality)
+    data = out.getvalue()
+    return {
+        'data': data,
+        'mime_type': MIME_TYPES[fmt],
+        'width': img.size[0],
+        'height': img.size[1],
+        'original_bytes': len(image_bytes),
+        'bytes': len(data),
+    }
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_process_pool():
+    """Returns the process-wide pool used for CPU-bound image work."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Not fork: the app and worker are multi-threaded (Streamlit, job threads,
+            # DB pool), and a forked child can inherit locks held by other threads
+            _pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=os.cpu_count(), mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+def preprocess_many(images_bytes):
+    """Preprocesses several images in parallel in the process pool; results are in input order."""
+    _, max_dim, fmt, quality = get_preprocess_settings()
+    n = len(images_bytes)
+    return list(get_process_pool().map(preprocess_image, images_bytes, [max_dim] * n, [fmt] * n, [quality] * n))
+
+class BackgroundWriter:
+    """
+    Writes files on a background thread so saving uploads doesn't sit on the
+    ingestion critical path. Each file is written to a temp name and renamed,
+    so readers never see a partial file. close() waits for pending writes and
+    returns [(path, error)] for the ones that failed.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._errors = []
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            path, data = item
+            try:
+                tmp_path = path + ".tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except Exception as e:
+                print(f"Error writing {path}: {e}")
+                self._errors.append((path, str(e)))
+
+    def submit(self, path, data):
+        self._queue.put((path, data))
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        return self._errors
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,168 @@
+"""
+Headless bulk ingestion: extracts every screenshot in a directory and saves
+the reviews to the database, without the Streamlit UI.
+
+Progress is checkpointed to a manifest (one JSON line per finished file), so
+rerunning the same command skips files that were already saved. Files that
+failed are retried on the next run. Re-extracting a file whose results were
+saved but not yet checkpointed is cheap (extraction cache) and safe
+(duplicates are skipped by content hash).
+
+Usage:
+    python ingest_cli.py uploads/
+    python ingest_cli.py uploads/ --workers 8 --chunk-size 100
+    python ingest_cli.py uploads/ --dry-run    # list what would be processed
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import db_utils
+import ocr_utils
+import normalize_utils
+import scheduler_utils
+import phash_utils
+import config_utils
+
+MANIFEST_PATH = os.path.join(".cache", "ingest_manifest.jsonl")
+DEFAULT_CHUNK_SIZE = 50
+# Files in these states are not processed again
+DONE_STATUSES = ("saved", "duplicate")
+
+def load_manifest(path):
+    """Returns {filename: latest entry}. Later lines override earlier ones."""
+    entries = {}
+    if not os.path.exists(path):
+        return entries
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash mid-write can leave a truncated last line
+                continue
+            entries[entry['file']] = entry
+    return entries
+
+def append_manifest(path, entries):
+    """Appends entries and flushes them to disk, so a checkpoint survives a crash."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+def pending_files(directory, manifest):
+    """Image files in directory that have no finished manifest entry for their current contents."""
+    pending = []
+    for name in sorted(os.listdir(directory)):
+        if not name.lower().endswith(phash_utils.IMAGE_EXTENSIONS):
+            continue
+        entry = manifest.get(name)
+        if entry and entry.get('status') in DONE_STATUSES:
+            # Only trust the entry if the file hasn't been replaced since
+            stat = os.stat(os.path.join(directory, name))
+            if entry.get('size') == stat.st_size and entry.get('mtime') == stat.st_mtime:
+                continue
+        pending.append(name)
+    return pending
+
+def ingest_chunk(directory, names, scheduler, batch_size):
+    """Extracts and saves one chunk of files; returns the manifest entries for it."""
+    items = []
+    for name in names:
+        with open(os.path.join(directory, name), "rb") as f:
+            items.append((name, f.read()))
+    stats = {name: os.stat(os.path.join(directory, name)) for name in names}
+
+    entries = {}
+    records = []
+    for name, data, cache_hit, _ in ocr_utils.extract_reviews_batched(items, scheduler, max_images=batch_size):
+        base = {'file': name, 'size': stats[name].st_size, 'mtime': stats[name].st_mtime, 'at': time.time()}
+        if "error" in data:
+            entries[name] = dict(base, status="failed", error=data['error'])
+            continue
+        data['source_filename'] = name
+        data['image_path'] = os.path.join(directory, name)
+        records.append(data)
+        entries[name] = base
+
+    if records:
+        # Dates and ratings for the whole chunk are parsed and validated in one pass
+        batch = normalize_utils.normalize_records(records)
+        for problem in batch.errors:
+            print(f"  {records[problem['row']]['source_filename']}: {problem['message']} ({problem['field']})")
+        result = db_utils.insert_reviews_bulk(batch)
+        if result is None:
+            # insert_reviews_bulk rolled back; leave these for the next run
+            for data in records:
+                entries[data['source_filename']].update(status="failed", error="database insert failed")
+        else:
+            inserted, skipped = result
+            for data in inserted:
+                entries[data['source_filename']]['status'] = "saved"
+            for data in skipped:
+                entries[data['source_filename']]['status'] = "duplicate"
+    return [entries[name] for name in names if name in entries]
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract review screenshots in a directory and save them to the database.")
+    parser.add_argument("directory", nargs="?", default="uploads", help="Directory of screenshots (default: uploads).")
+    parser.add_argument("--manifest", default=MANIFEST_PATH, help=f"Progress manifest (default: {MANIFEST_PATH}).")
+    parser.add_argument("--workers", type=int, default=None, help="Concurrent Gemini requests (default: OCR_MAX_WORKERS).")
+    parser.add_argument("--batch-size", type=int, default=None, help="Screenshots per Gemini request (default: OCR_BATCH_SIZE).")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Files saved and checkpointed together.")
+    parser.add_argument("--limit", type=int, default=None, help="Process at most this many files.")
+    parser.add_argument("--dry-run", action="store_true", help="List pending files without processing them.")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        print(f"Not a directory: {args.directory}")
+        return 1
+
+    manifest = load_manifest(args.manifest)
+    pending = pending_files(args.directory, manifest)
+    if args.limit:
+        pending = pending[:args.limit]
+    print(f"{len(pending)} file(s) to process in {args.directory} ({len(manifest)} already in the manifest).")
+    if args.dry_run or not pending:
+        for name in pending:
+            print(f"  {name}")
+        return 0
+
+    db_utils.bootstrap_schema()
+
+    scheduler = scheduler_utils.get_scheduler()
+    if args.workers:
+        scheduler.max_workers = args.workers
+    batch_size = args.batch_size or ocr_utils.get_batch_size()
+
+    totals = {"saved": 0, "duplicate": 0, "failed": 0}
+    start = time.time()
+    for offset in range(0, len(pending), args.chunk_size):
+        chunk = pending[offset:offset + args.chunk_size]
+        entries = ingest_chunk(args.directory, chunk, scheduler, batch_size)
+        append_manifest(args.manifest, entries)
+        for entry in entries:
+            totals[entry['status']] += 1
+            if entry['status'] == "failed":
+                print(f"  Failed {entry['file']}: {entry['error']}")
+        done = offset + len(chunk)
+        print(f"[{done}/{len(pending)}] saved {totals['saved']}, duplicates {totals['duplicate']}, "
+              f"failed {totals['failed']} ({time.time() - start:.0f}s)")
+
+    print(f"Done: {totals['saved']} saved, {totals['duplicate']} duplicates, {totals['failed']} failed.")
+    parse = ocr_utils.get_parse_stats()
+    if parse['responses']:
+        print(f"Parse failures: {parse['repaired'] + parse['failed']}/{parse['responses']} answers "
+              f"({parse['parse_failure_rate']:.1%}), {parse['repaired']} repaired, {parse['failed']} wasted.")
+    if totals['failed']:
+        print("Rerun the same command to retry the failed files.")
+        return 2
+    return 0
+
+if __name__ == "__main__":
+    config_utils.load_secrets_into_env()
+    sys.exit(main())
@@ -0,0 +1,209 @@
+import time
+import threading
+import datetime
+from contextlib import contextmanager
+import psycopg2.extras
+import db_utils
+from config_utils import get_setting
+
+# Job lifecycle: queued -> running -> done | failed
+ACTIVE_STATUSES = ('queued', 'running')
+# Running jobs refresh heartbeat_at this often; a job silent for STALE_AFTER
+# seconds is assumed to belong to a dead worker and is requeued
+HEARTBEAT_INTERVAL = 15
+STALE_AFTER = 120
+MAX_ATTEMPTS = 3
+# In-memory data handed to an embedded worker (see submit_job); entries a
+# worker in this process never picked up are dropped after this many seconds
+STAGED_TTL = 600
+JOB_COLUMNS = ['id', 'kind', 'status', 'payload', 'result', 'error', 'progress', 'progress_message',
+               'attempts', 'created_at', 'started_at', 'finished_at', 'worker']
+
+def embedded_worker_enabled():
+    """
+    True unless JOB_WORKER = "external". In embedded mode the app process runs
+    the worker threads itself (e.g. on Streamlit Cloud, where there is no
+    separate process); jobs still survive reruns and page reloads.
+    """
+    return str(get_setting("JOB_WORKER", "embedded")).lower() != "external"
+
+def worker_concurrency():
+    """Jobs the embedded worker runs at the same time (JOB_WORKER_CONCURRENCY)."""
+    return int(get_setting("JOB_WORKER_CONCURRENCY", 2))
+
+_staged = {}
+_staged_lock = threading.Lock()
+
+def take_staged(job_id):
+    """Returns (and forgets) the data staged in memory for job_id by this process, or None."""
+    with _staged_lock:
+        entry = _staged.pop(job_id, None)
+    return entry[1] if entry else None
+
+def _row_to_job(cur, row):
+    return dict(zip([d[0] for d in cur.description], row)) if row else None
+
+def submit_job(kind, payload, staged=None):
+    """
+    Queues a job and returns its id.
+    staged: data too big for the payload (e.g. upload bytes) that an embedded
+    worker in this process picks up with take_staged(); workers elsewhere
+    don't see it, so the payload must still be enough to run the job.
+    """
+    # The app only starts the bootstrap in the background; make sure it has run
+    db_utils.bootstrap_schema()
+    with db_utils.get_conn() as conn:
+        try:
+            cur = conn.cursor()
+            cur.execute(
+                "INSERT INTO jobs (kind, payload) VALUES (%s, %s) RETURNING id",
+                (kind, psycopg2.extras.Json(payload))
+            )
+            job_id = cur.fetchone()[0]
+            if staged is not None:
+                # Before the commit, so a worker can't claim the job first
+                now = time.monotonic()
+                with _staged_lock:
+                    for old_id in [k for k, (at, _) in _staged.items() if now - at > STAGED_TTL]:
+                        del _staged[old_id]
+                    _staged[job_id] = (now, staged)
+            conn.commit()
+            cur.close()
+            return job_id
+        except Exception as e:
+            print(f"Error submitting {kind} job: {e}")
+            conn.rollback()
+            return None
+
+def get_job(job_id):
+    """Returns the job as a dict (see JOB_COLUMNS), or None if it doesn't exist."""
+    with db_utils.get_conn() as conn:
+        try:
+            cur = conn.cursor()
+            cur.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE id = %s", (job_id,))
+            job = _row_to_job(cur, cur.fetchone())
+            conn.commit()
+            cur.close()
+            return job
+        except Exception as e:
+            print(f"Error fetching job {job_id}: {e}")
+            conn.rollback()
+            return None
+
+def list_jobs(kind=None, limit=20):
+    """Most recent jobs first, without payloads and results."""
+    columns = [c for c in JOB_COLUMNS if c not in ('payload', 'result')]
+    where = "WHERE kind = %s" if kind else ""
+    params = ([kind] if kind else []) + [limit]
+    with db_utils.get_conn() as conn:
+        try:
+            cur = conn.cursor()
+            cur.execute(f"SELECT {', '.join(columns)} FROM jobs {where} ORDER BY id DESC LIMIT %s", params)
+            jobs = [_row_to_job(cur, row) for row in cur.fetchall()]
+            conn.commit()
+            cur.close()
+            return jobs
+        except Exception as e:
+            print(f"Error listing jobs: {e}")
+            conn.rollback()
+            return []
+
+def claim_job(worker_id, kinds):
+    """
+    Atomically takes the oldest queued job of one of kinds and marks it running.
+    SKIP LOCKED lets any number of workers poll the table without blocking each other.
+    Returns the job dict, or None if the queue is empty.
+    """
+    with db_utils.get_conn() as conn:
+        try:
+            cur = conn.cursor()
+            cur.execute(f"""
+                UPDATE jobs
+                SET status = 'running', attempts = attempts + 1, worker = %s,
+                    started_at = CURRENT_TIMESTAMP, heartbeat_at = CURRENT_TIMESTAMP
+                WHERE id = (
+                    SELECT id FROM jobs
+                    WHERE status = 'queued' AND kind = ANY(%s)
+                    ORDER BY id
+                    FOR UPDATE SKIP LOCKED
+                    LIMIT 1
+                )
+                RETURNING {', '.join(JOB_COLUMNS)}
+            """, (worker_id, list(kinds)))
+            job = _row_to_job(cur, cur.fetchone())
+            conn.commit()
+            cur.close()
+            return job
+        except Exception as e:
+            print(f"Error claiming job: {e}")
+            conn.rollback()
+            return None
+
+def _update(job_id, assignments, params):
+    with db_utils.get_conn() as conn:
+        try:
+            cur = conn.cursor()
+            cur.execute(f"UPDATE jobs SET {assignments} WHERE id = %s", list(params) + [job_id])
+            conn.commit()
+            cur.close()
+        except Exception as e:
+            print(f"Error updating job {job_id}: {e}")
+            conn.rollback()
+
+def update_progress(job_id, progress, message=None, partial_result=None):
+    """Records progress (0-1) and optionally a partial result the UI can show while the job runs."""
+    if partial_result is None:
+        _update(job_id, "progress = %s, progress_message = %s, heartbeat_at = CURRENT_TIMESTAMP",
+                (progress, message))
+    else:
+        _update(job_id, "progress = %s, progress_message = %s, result = %s, heartbeat_at = CURRENT_TIMESTAMP",
+                (progress, message, psycopg2.extras.Json(partial_result)))
+
+def complete_job(job_id, result):
+    _update(job_id, "status = 'done', progress = 1, result = %s, finished_at = CURRENT_TIMESTAMP",
+            (psycopg2.extras.Json(result),))
+
+def fail_job(job_id, error):
+    _update(job_id, "status = 'failed', error = %s, finished_at = CURRENT_TIMESTAMP", (error,))
+
+def requeue_stale_jobs():
+    """
+    Puts running jobs whose worker stopped heartbeating back in the queue,
+    or fails them once they have used up MAX_ATTEMPTS. Returns how many were touched.
+    """
+    with db_utils.get_conn() as conn:
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                UPDATE jobs
+                SET status = CASE WHEN attempts < %s THEN 'queued' ELSE 'failed' END,
+                    error = CASE WHEN attempts < %s THEN error ELSE 'Worker stopped responding' END,
+                    finished_at = CASE WHEN attempts < %s THEN NULL ELSE CURRENT_TIMESTAMP END,
+                    worker = NULL
+                WHERE status = 'running' AND heartbeat_at < CURRENT_TIMESTAMP - %s
+            """, (MAX_ATTEMPTS, MAX_ATTEMPTS, MAX_ATTEMPTS, datetime.timedelta(seconds=STALE_AFTER)))
+            touched = cur.rowcount
+            conn.commit()
+            cur.close()
+            return touched
+        except Exception as e:
+            print(f"Error requeueing stale jobs: {e}")
+            conn.rollback()
+            return 0
+
+@contextmanager
+def heartbeat(job_id):
+    """Keeps heartbeat_at fresh while the block runs, even if the job reports no progress."""
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(HEARTBEAT_INTERVAL):
+            _update(job_id, "heartbeat_at = CURRENT_TIMESTAMP", ())
+
+    thread = threading.Thread(target=beat, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
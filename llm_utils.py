@@ -0,0 +1,200 @@
+import re
+import json
+import time
+import threading
+from collections import OrderedDict
+from config_utils import get_setting
+
+# Project-wide default model
+DEFAULT_MODEL = 'gemini-3-flash-preview'
+# Chat builds a new system instruction per context, so keep the handle cache bounded
+MAX_CACHED_MODELS = 32
+
+class GeminiBackend:
+    """Google Gemini via google-generativeai."""
+
+    def __init__(self):
+        import google.generativeai as genai
+        self.genai = genai
+        self.configured = False
+
+    def configure(self):
+        # genai.configure() drops the SDK's cached clients (and their open
+        # connections), so it must only run once per process
+        if self.configured:
+            return True
+        api_key = get_setting("GOOGLE_API_KEY")
+        if not api_key:
+            return False
+        self.genai.configure(api_key=api_key)
+        self.configured = True
+        return True
+
+    def make_model(self, name, system_instruction=None):
+        if not self.configure():
+            raise ValueError("Google API Key not found in secrets.toml or environment variables.")
+        return self.genai.GenerativeModel(name, system_instruction=system_instruction)
+
+class _FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+    def __iter__(self):
+        # Streaming: hand the text out in a few chunks
+        for start in range(0, len(self.text), 200):
+            yield _FakeResponse(self.text[start:start + 200])
+
+class _FakeChat:
+    def __init__(self, model, history):
+        self.model = model
+        self.history = list(history or [])
+
+    def send_message(self, message, stream=False):
+        self.history.append({'role': 'user', 'parts': [message]})
+        return self.model.generate_content(self.history, stream=stream)
+
+class FakeModel:
+    """
+    Offline stand-in with the GenerativeModel interface. Returns canned
+    extraction JSON for image requests and a placeholder answer for text.
+    """
+
+    def __init__(self, name, system_instruction=None):
+        self.name = name
+        self.system_instruction = system_instruction
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        parts = contents if isinstance(contents, list) else [contents]
+        labels = [p for p in parts if isinstance(p, str) and re.fullmatch(r"Image \d+:", p.strip())]
+        has_image = any(not isinstance(p, (str, dict)) or (isinstance(p, dict) and 'mime_type' in p) for p in parts)
+        if labels:
+            records = [dict(self._record(i), image=label.strip().rstrip(':')) for i, label in enumerate(labels, start=1)]
+            text = json.dumps(records, ensure_ascii=False)
+        elif has_image:
+            text = json.dumps(self._record(1), ensure_ascii=False)
+        else:
+            text = f"(Fake {self.name} response) Received {len(parts)} part(s)."
+        return _FakeResponse(text)
+
+    def start_chat(self, history=None):
+        return _FakeChat(self, history)
+
+    @staticmethod
+    def _record(i):
+        return {
+            'user_name': f"Fake User {i}", 'review_date': "01/15", 'rating_overall': 5.0,
+            'rating_taste': 5.0, 'rating_env': 4.5, 'rating_service': 5.0, 'rating_value': 4.5,
+            'content': f"Fake review content {i}.",
+        }
+
+class FakeBackend:
+    """Local fake model for development and tests (LLM_BACKEND = "fake"); never calls the network."""
+
+    def configure(self):
+        return True
+
+    def make_model(self, name, system_instruction=None):
+        return FakeModel(name, system_instruction)
+
+_BACKEND_FACTORIES = {
+    'gemini': GeminiBackend,
+    'fake': FakeBackend,
+}
+
+def register_backend(name, factory):
+    """Adds a backend; factory() returns an object with configure() and make_model(name, system_instruction)."""
+    _BACKEND_FACTORIES[name] = factory
+
+class _Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.by_model = {}
+
+    def record(self, name, seconds, error):
+        with self.lock:
+            entry = self.by_model.setdefault(name, {'calls': 0, 'errors': 0, 'seconds': 0.0})
+            entry['calls'] += 1
+            entry['errors'] += int(error)
+            entry['seconds'] += seconds
+
+class _InstrumentedModel:
+    """Wraps a model so every request is timed and counted (stream=True times until the stream opens)."""
+
+    def __init__(self, model, name, stats):
+        self._model = model
+        self._name = name
+        self._stats = stats
+
+    def _timed(self, fn, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self._stats.record(self._name, time.perf_counter() - start, True)
+            raise
+        self._stats.record(self._name, time.perf_counter() - start, False)
+        return result
+
+    def generate_content(self, *args, **kwargs):
+        return self._timed(self._model.generate_content, *args, **kwargs)
+
+    def start_chat(self, *args, **kwargs):
+        chat = self._model.start_chat(*args, **kwargs)
+        send = chat.send_message
+        chat.send_message = lambda *a, **kw: self._timed(send, *a, **kw)
+        return chat
+
+class LLMClient:
+    """
+    Process-wide entry point for model calls: picks the backend once,
+    configures it once, and reuses model handles per (name, system instruction).
+    """
+
+    def __init__(self, backend_name):
+        if backend_name not in _BACKEND_FACTORIES:
+            raise ValueError(f"Unknown LLM backend '{backend_name}'. Available: {', '.join(sorted(_BACKEND_FACTORIES))}")
+        self.backend_name = backend_name
+        self.backend = _BACKEND_FACTORIES[backend_name]()
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = _Stats()
+
+    def configure(self):
+        with self._lock:
+            return self.backend.configure()
+
+    def get_model(self, name=DEFAULT_MODEL, system_instruction=None):
+        key = (name, system_instruction)
+        with self._lock:
+            model = self._models.get(key)
+            if model is None:
+                model = _InstrumentedModel(self.backend.make_model(name, system_instruction), name, self._stats)
+                self._models[key] = model
+                if len(self._models) > MAX_CACHED_MODELS:
+                    self._models.popitem(last=False)
+            else:
+                self._models.move_to_end(key)
+            return model
+
+    def stats(self):
+        """Per-model request counts, errors and total seconds for this process."""
+        with self._stats.lock:
+            return {name: dict(entry) for name, entry in self._stats.by_model.items()}
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """Returns the process-wide client for the backend named by LLM_BACKEND (default: gemini)."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = LLMClient(str(get_setting("LLM_BACKEND", "gemini")).lower())
+        return _client
+
+def configure():
+    """True if the backend is usable (for Gemini: an API key is configured)."""
+    return get_client().configure()
+
+def get_model(name=DEFAULT_MODEL, system_instruction=None):
+    return get_client().get_model(name, system_instruction)
@@ -0,0 +1,262 @@
+"""
+Ordered schema migrations for the reviews database.
+
+Each migration has a version; applied versions are recorded in the
+schema_version table, so running this again only applies what is pending.
+
+Usage:
+    python migrations.py              # apply all pending migrations
+    python migrations.py --dry-run    # list what would run
+    python migrations.py --target 3   # stop after version 3
+"""
+import argparse
+import psycopg2
+import psycopg2.extras
+import db_utils
+import config_utils
+
+# Arbitrary key for pg_advisory_lock so only one process migrates at a time
+MIGRATION_LOCK_KEY = 727001
+BACKFILL_BATCH_SIZE = 1000
+
+class Migration:
+    """
+    A single schema change.
+    sql: statement(s) to execute, or a callable taking (cursor).
+    transactional: False for online operations (CREATE INDEX CONCURRENTLY,
+    batched backfills) that must run in autocommit mode.
+    """
+
+    def __init__(self, version, name, sql, transactional=True):
+        self.version = version
+        self.name = name
+        self.sql = sql
+        self.transactional = transactional
+
+    def describe(self):
+        if callable(self.sql):
+            return self.sql.__doc__.strip() if self.sql.__doc__ else self.sql.__name__
+        return self.sql.strip()
+
+def _apply_baseline(cur):
+    """Apply schema.sql (tables, columns, triggers)."""
+    with open('schema.sql', 'r') as f:
+        cur.execute(f.read())
+
+def _backfill_content_hash(cur):
+    """Backfill reviews.content_hash in batches of BACKFILL_BATCH_SIZE rows."""
+    # Hashes are computed in Python so they match db_utils.compute_content_hash exactly
+    cur.execute("SELECT content_hash FROM reviews WHERE content_hash IS NOT NULL")
+    taken = {row[0] for row in cur.fetchall()}
+
+    last_id = 0
+    updated = 0
+    duplicates = []
+    while True:
+        cur.execute(
+            "SELECT id, user_name, content FROM reviews WHERE content_hash IS NULL AND id > %s ORDER BY id LIMIT %s",
+            (last_id, BACKFILL_BATCH_SIZE)
+        )
+        rows = cur.fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        updates = []
+        for review_id, user_name, content in rows:
+            content_hash = db_utils.compute_content_hash(user_name, content)
+            if content_hash in taken:
+                # Keep the oldest row as the canonical one; leave the copy unhashed
+                duplicates.append(review_id)
+                continue
+            taken.add(content_hash)
+            updates.append((review_id, content_hash))
+
+        # Autocommit: each batch is its own short transaction, so ingestion keeps running
+        if updates:
+            psycopg2.extras.execute_values(
+                cur,
+                "UPDATE reviews SET content_hash = v.content_hash FROM (VALUES %s) AS v (id, content_hash) WHERE reviews.id = v.id",
+                updates
+            )
+        updated += len(updates)
+        print(f"  Backfilled {updated} rows...")
+
+    if duplicates:
+        print(f"  Found {len(duplicates)} existing duplicate rows (left without a hash): {duplicates}")
+
+def _backfill_updated_at(cur):
+    """Reset reviews.updated_at to created_at for rows stamped when the column was added, in batches."""
+    # ADD COLUMN ... DEFAULT CURRENT_TIMESTAMP gave every existing row the same
+    # value, the oldest in the table; delta refreshes would re-read all of them
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION reviews_touch_updated_at() RETURNS trigger AS $$
+        BEGIN
+            IF NEW.updated_at IS NOT DISTINCT FROM OLD.updated_at THEN
+                NEW.updated_at := CURRENT_TIMESTAMP;
+            END IF;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    cur.execute("SELECT MIN(updated_at) FROM reviews")
+    stamp = cur.fetchone()[0]
+    if stamp is None:
+        return
+
+    last_id = 0
+    updated = 0
+    while True:
+        cur.execute(
+            "SELECT id FROM reviews WHERE updated_at = %s AND created_at < updated_at AND id > %s ORDER BY id LIMIT %s",
+            (stamp, last_id, BACKFILL_BATCH_SIZE)
+        )
+        ids = [row[0] for row in cur.fetchall()]
+        if not ids:
+            break
+        last_id = ids[-1]
+        # Autocommit: each batch is its own short transaction
+        cur.execute("UPDATE reviews SET updated_at = created_at WHERE id = ANY(%s)", (ids,))
+        updated += len(ids)
+        print(f"  Backfilled {updated} rows...")
+
+def _create_index_concurrently(name, definition):
+    """Builds a migration step that creates an index without blocking writes."""
+    def step(cur):
+        # A failed CONCURRENTLY build leaves an INVALID index that IF NOT EXISTS would skip
+        cur.execute(
+            "SELECT NOT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = %s",
+            (name,)
+        )
+        row = cur.fetchone()
+        if row and row[0]:
+            print(f"  Dropping invalid index {name}...")
+            cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+        cur.execute(f"CREATE {definition.format(name=name)}")
+    step.__doc__ = f"CREATE {definition.format(name=name)}"
+    return step
+
+MIGRATIONS = [
+    Migration(1, "baseline schema", _apply_baseline),
+    Migration(2, "backfill content_hash", _backfill_content_hash, transactional=False),
+    Migration(3, "unique index on content_hash", _create_index_concurrently(
+        "idx_reviews_content_hash", "UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {name} ON reviews (content_hash)"), transactional=False),
+    Migration(4, "index on updated_at", _create_index_concurrently(
+        "idx_reviews_updated_at", "INDEX CONCURRENTLY IF NOT EXISTS {name} ON reviews (updated_at)"), transactional=False),
+    Migration(5, "index on tombstone deleted_at", _create_index_concurrently(
+        "idx_review_tombstones_deleted_at", "INDEX CONCURRENTLY IF NOT EXISTS {name} ON review_tombstones (deleted_at)"), transactional=False),
+    Migration(6, "index on review_date", _create_index_concurrently(
+        "idx_reviews_review_date", "INDEX CONCURRENTLY IF NOT EXISTS {name} ON reviews (review_date)"), transactional=False),
+    Migration(7, "keyset index on (review_date, id)", _create_index_concurrently(
+        "idx_reviews_review_date_id", "INDEX CONCURRENTLY IF NOT EXISTS {name} ON reviews (review_date, id)"), transactional=False),
+    Migration(8, "keyset index on (rating_overall, id)", _create_index_concurrently(
+        "idx_reviews_rating_overall_id", "INDEX CONCURRENTLY IF NOT EXISTS {name} ON reviews (rating_overall, id)"), transactional=False),
+    Migration(9, "background job queue", """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id SERIAL PRIMARY KEY,
+            kind TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            payload JSONB NOT NULL DEFAULT '{}',
+            result JSONB,
+            error TEXT,
+            progress REAL NOT NULL DEFAULT 0,
+            progress_message TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            worker TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP,
+            heartbeat_at TIMESTAMP
+        );
+        -- Workers poll for the oldest queued job; keep that lookup tiny
+        CREATE INDEX IF NOT EXISTS idx_jobs_queued ON jobs (id) WHERE status = 'queued';
+        CREATE INDEX IF NOT EXISTS idx_jobs_running ON jobs (heartbeat_at) WHERE status = 'running';
+    """),
+    Migration(10, "backfill updated_at from created_at", _backfill_updated_at, transactional=False),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+def _ensure_version_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cur.execute("ALTER TABLE schema_version ADD COLUMN IF NOT EXISTS name TEXT")
+
+def get_applied_versions(cur):
+    cur.execute("SELECT version FROM schema_version")
+    return {row[0] for row in cur.fetchall()}
+
+def _record(cur, migration):
+    cur.execute(
+        "INSERT INTO schema_version (version, name) VALUES (%s, %s) ON CONFLICT (version) DO UPDATE SET name = EXCLUDED.name, applied_at = CURRENT_TIMESTAMP",
+        (migration.version, migration.name)
+    )
+
+def migrate(target=None, dry_run=False):
+    """
+    Applies pending migrations in version order, up to target (default: latest).
+    Stops at the first failure; that migration is not recorded, so the next run retries it.
+    Returns True if the database is at the target version afterwards.
+    """
+    target = LATEST_VERSION if target is None else target
+    conn = db_utils.get_db_connection()
+    try:
+        conn.autocommit = True
+        cur = conn.cursor()
+        cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_KEY,))
+        try:
+            _ensure_version_table(cur)
+            applied = get_applied_versions(cur)
+            pending = [m for m in MIGRATIONS if m.version not in applied and m.version <= target]
+            if not pending:
+                print(f"Schema is up to date (version {max(applied) if applied else 0}).")
+                return True
+
+            for migration in pending:
+                mode = "transactional" if migration.transactional else "online"
+                print(f"[{migration.version}] {migration.name} ({mode})")
+                if dry_run:
+                    print("  " + migration.describe().replace("\n", "\n  "))
+                    continue
+
+                conn.autocommit = not migration.transactional
+                try:
+                    if callable(migration.sql):
+                        migration.sql(cur)
+                    else:
+                        cur.execute(migration.sql)
+                    _record(cur, migration)
+                    if migration.transactional:
+                        conn.commit()
+                except Exception as e:
+                    print(f"Migration {migration.version} failed: {e}")
+                    if not conn.autocommit:
+                        conn.rollback()
+                    return False
+                finally:
+                    conn.autocommit = True
+
+            if dry_run:
+                print(f"Dry run: {len(pending)} migration(s) pending.")
+            else:
+                print(f"Schema migrated to version {pending[-1].version}.")
+            return not dry_run
+        finally:
+            cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_KEY,))
+            cur.close()
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    config_utils.load_secrets_into_env()
+
+    parser = argparse.ArgumentParser(description="Apply pending database migrations.")
+    parser.add_argument("--dry-run", action="store_true", help="List pending migrations without applying them.")
+    parser.add_argument("--target", type=int, default=None, help="Stop after this version.")
+    args = parser.parse_args()
+
+    migrate(target=args.target, dry_run=args.dry_run)
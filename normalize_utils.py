@@ -0,0 +1,93 @@
+import datetime
+import numpy as np
+import pandas as pd
+
+RATING_COLUMNS = ['rating_overall', 'rating_taste', 'rating_env', 'rating_service', 'rating_value']
+TEXT_COLUMNS = ['user_name', 'content', 'image_path', 'source_filename']
+RATING_MIN = 0.0
+RATING_MAX = 5.0
+# "12/29", "12-29", "12/29 18:37": month/day with no year
+_NO_YEAR_PATTERN = r'^(\d{1,2})[/-](\d{1,2})(?:\s+\d{1,2}:\d{2})?$'
+
+class ReviewBatch:
+    """
+    Extracted reviews as one typed DataFrame (review_date: datetime64,
+    ratings: float64, text: object) plus the validation problems found
+    while normalizing, as dicts with row, field and message.
+    """
+
+    def __init__(self, df, errors):
+        self.df = df
+        self.errors = errors
+
+    def __len__(self):
+        return len(self.df)
+
+    def to_records(self):
+        """Rows as plain dicts (YYYY-MM-DD dates, None for missing values), e.g. for insert_reviews_bulk."""
+        df = self.df.copy()
+        df['review_date'] = df['review_date'].dt.strftime('%Y-%m-%d')
+        return df.astype(object).where(df.notna(), None).to_dict(orient='records')
+
+def _month_day_in(year, month_day):
+    return pd.to_datetime(str(year) + "-" + month_day[0] + "-" + month_day[1], errors='coerce', format='%Y-%m-%d')
+
+def normalize_dates(raw, today=None):
+    """
+    Parses a Series of extracted dates in one pass. Dates without a year
+    (screenshots show MM/DD for recent reviews) get the latest year that
+    doesn't put them after today; anything unparseable becomes today.
+    Returns (dates as datetime64 Series, boolean Series marking the fallbacks).
+    """
+    today = pd.Timestamp(today or datetime.date.today()).normalize()
+    # "2025年12月28日" / "12月29日" -> "2025-12-28" / "12-29"
+    text = raw.astype("string").str.strip().str.replace(r'[年月]', '-', regex=True).str.replace('日', '')
+
+    month_day = text.str.extract(_NO_YEAR_PATTERN)
+    no_year = month_day[0].notna()
+    parsed = pd.to_datetime(text.mask(no_year), errors='coerce', format='mixed').dt.normalize()
+    if no_year.any():
+        this_year = _month_day_in(today.year, month_day[no_year])
+        last_year = _month_day_in(today.year - 1, month_day[no_year])
+        # e.g. "12/29" read on 2026-10-18 is 2025-12-29
+        parsed[no_year] = this_year.where(this_year <= today, last_year)
+    fallback = parsed.isna()
+    return parsed.fillna(today), fallback
+
+def normalize_ratings(raw):
+    """
+    Converts a Series of extracted ratings to floats clamped to 0-5.
+    Returns (ratings, boolean Series of values that weren't numbers, boolean Series of values out of range).
+    """
+    values = pd.to_numeric(raw, errors='coerce')
+    not_numeric = values.isna() & raw.notna()
+    out_of_range = (values < RATING_MIN) | (values > RATING_MAX)
+    return values.clip(RATING_MIN, RATING_MAX), not_numeric, out_of_range
+
+def normalize_records(records, today=None):
+    """Normalizes a whole batch of extraction dicts into a ReviewBatch, column by column."""
+    df = pd.DataFrame.from_records(records)
+    for column in ['review_date'] + RATING_COLUMNS + TEXT_COLUMNS:
+        if column not in df.columns:
+            df[column] = None
+    errors = []
+
+    def flag(mask, field, message):
+        for row in np.flatnonzero(mask.to_numpy()):
+            errors.append({'row': int(row), 'field': field, 'message': message.format(value=df[field].iloc[row])})
+
+    dates, fallback = normalize_dates(df['review_date'], today)
+    missing = df['review_date'].isna()
+    flag(fallback & missing, 'review_date', "Missing date; used today instead")
+    flag(fallback & ~missing, 'review_date', "Unreadable date '{value}'; used today instead")
+    df['review_date'] = dates
+
+    for column in RATING_COLUMNS:
+        ratings, not_numeric, out_of_range = normalize_ratings(df[column])
+        flag(not_numeric, column, "Not a number: '{value}'; left empty")
+        flag(out_of_range, column, "Rating {value} is outside 0-5; clamped")
+        df[column] = ratings
+
+    for column in TEXT_COLUMNS:
+        df[column] = df[column].where(df[column].notna(), None)
+    return ReviewBatch(df, errors)
@@ -1,36 +1,22 @@
-import google.generativeai as genai
 import json
-import os
 from PIL import Image
-import streamlit as st
-import re
+import io
+import hashlib
+import threading
+import cache_utils
+import image_utils
+import llm_utils
+import scheduler_utils
+import sentiment_utils
+from config_utils import get_setting
 
-def configure_genai():
-    """Configures the Gemini API key from Streamlit secrets or environment variables."""
-    try:
-        api_key = st.secrets["GOOGLE_API_KEY"]
-    except (FileNotFoundError, KeyError):
-        api_key = os.getenv("GOOGLE_API_KEY")
-    
-    if not api_key:
-        raise ValueError("Google API Key not found in secrets.toml or environment variables.")
-    
-    genai.configure(api_key=api_key)
+# Using gemini-3-flash-preview as requested
+MODEL_NAME = llm_utils.DEFAULT_MODEL
 
-def extract_review_data(image):
-    """
-    Sends an image to Gemini 1.5 Flash to extract review data.
-    Returns a dictionary with Username, Date, Rating, and Content.
-    """
-    configure_genai()
-    
-    # Using gemini-3-flash-preview as requested
-    model = genai.GenerativeModel('gemini-3-flash-preview')
-    
-    prompt = """
+EXTRACTION_PROMPT = """
     Analyze this image of a customer review. Extract the following information into a JSON object:
     - user_name: The name of the reviewer.
-    - review_date: The date of the review. If format is MM/DD, convert to MM-DD. If year is missing, ALWAYS assume 2026.
+    - review_date: The date of the review. If format is MM/DD, convert to MM-DD. If year is missing, do NOT add one; keep MM-DD.
     - rating_overall: The numeric rating (e.g., 4.5). Count ONLY stars colored in ORANGE. Do NOT count GREY stars. Count half stars if they are orange.
     - rating_taste: Rating for taste/food quality if present (float).
     - rating_env: Rating for environment/atmosphere if present (float).
@@ -40,53 +26,365 @@ def extract_review_data(image):
     
     If any field is missing, use null. Return ONLY the JSON.
     """
-    
+
+# Several screenshots per request: the instructions are sent once, answers come back as an array
+BATCH_EXTRACTION_PROMPT = """
+    You will receive {count} images of customer reviews, each preceded by its label ("Image 1", "Image 2", ...).
+    Treat every image independently and apply these instructions to each one:
+    """ + EXTRACTION_PROMPT.replace("Return ONLY the JSON.", "") + """
+    Return ONLY a JSON array with exactly {count} objects, one per image, in the same order as the images.
+    Each object must have an "image" field with the image's label, plus the fields above.
+    """
+# Upper bounds for one batched request; inline requests are capped at 20 MB (base64 adds a third)
+BATCH_MAX_IMAGES = 8
+BATCH_MAX_BYTES = 12 * 1024 * 1024
+
+# Structured output: the model must answer with JSON matching these schemas
+REVIEW_FIELD_TYPES = {
+    'user_name': 'STRING', 'review_date': 'STRING', 'rating_overall': 'NUMBER', 'rating_taste': 'NUMBER',
+    'rating_env': 'NUMBER', 'rating_service': 'NUMBER', 'rating_value': 'NUMBER', 'content': 'STRING',
+}
+REVIEW_SCHEMA = {
+    'type': 'OBJECT',
+    'properties': {field: {'type': t, 'nullable': True} for field, t in REVIEW_FIELD_TYPES.items()},
+    'required': list(REVIEW_FIELD_TYPES),
+}
+BATCH_REVIEW_SCHEMA = {
+    'type': 'ARRAY',
+    'items': dict(REVIEW_SCHEMA,
+                  properties=dict(REVIEW_SCHEMA['properties'], image={'type': 'STRING'}),
+                  required=['image'] + REVIEW_SCHEMA['required']),
+}
+# One cheap text-only request to fix output that still doesn't parse
+REPAIR_PROMPT = """
+    The text below was supposed to be valid JSON matching the response schema, but parsing failed with: {error}
+    Return the same data as valid JSON. Do not add, drop or change any values.
+    """
+
+# Cached extractions are only reused for the same model and prompts
+EXTRACTION_VERSION = hashlib.sha256((MODEL_NAME + EXTRACTION_PROMPT + BATCH_EXTRACTION_PROMPT).encode('utf-8')).hexdigest()[:16]
+
+class _ParseStats:
+    """Counts model answers that needed a repair pass, or couldn't be parsed at all."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.responses = 0
+        self.repaired = 0
+        self.failed = 0
+
+    def record(self, repaired=False, failed=False):
+        with self.lock:
+            self.responses += 1
+            self.repaired += int(repaired)
+            self.failed += int(failed)
+
+    def snapshot(self):
+        with self.lock:
+            bad = self.repaired + self.failed
+            return {
+                'responses': self.responses,
+                'repaired': self.repaired,
+                'failed': self.failed,
+                'parse_failure_rate': bad / self.responses if self.responses else 0.0,
+            }
+
+_parse_stats = _ParseStats()
+
+class ExtractionStats(scheduler_utils.CallStats):
+    """
+    Counters for one extraction run (e.g. one job): scheduler calls, retries
+    and throttling plus structured-output parse outcomes. Pass it as stats to
+    extract_reviews_batched; the process-wide counters are updated as well.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.parse = _ParseStats()
+
+    def record(self, repaired=False, failed=False):
+        self.parse.record(repaired=repaired, failed=failed)
+
+    def snapshot(self):
+        return dict(super().snapshot(), **self.parse.snapshot())
+
+def get_parse_stats():
+    """Structured-output parse counters for this process (repaired + failed = parse failures)."""
+    return _parse_stats.snapshot()
+
+def _parse_json(text, expected_type):
+    text = text.strip()
+    if text.startswith('```'):
+        # Tolerate a code fence around otherwise valid JSON
+        text = text.strip('`').removeprefix('json').strip()
+    data = json.loads(text)
+    if not isinstance(data, expected_type):
+        raise ValueError(f"Expected a JSON {expected_type.__name__}, got {type(data).__name__}")
+    return data
+
+def _generate_json(model, parts, schema, expected_type, stats=None):
+    """
+    Requests schema-constrained JSON and parses it. Output that still fails to
+    parse gets one repair request (text only, no images) before giving up.
+    The outcome is counted in the process-wide parse stats and in stats, if given.
+    """
+    counters = [_parse_stats] + ([stats] if stats is not None else [])
+
+    def record(**outcome):
+        for counter in counters:
+            counter.record(**outcome)
+
+    config = {'response_mime_type': 'application/json', 'response_schema': schema}
+    text = model.generate_content(parts, generation_config=config).text
     try:
-        response = model.generate_content([prompt, image])
-        # Clean up code blocks if present
-        text_response = response.text.strip()
-        
-        # Try to find JSON block using regex
-        match = re.search(r'\{.*\}', text_response, re.DOTALL)
-        if match:
-            json_str = match.group(0)
-        else:
-            # Fallback to original cleanup if no curly braces found (unlikely for valid JSON)
-            json_str = text_response.replace('```json', '').replace('```', '').strip()
-            
-        data = json.loads(json_str)
+        data = _parse_json(text, expected_type)
+        record()
+        return data
+    except ValueError as e:
+        print(f"Unparseable model output ({e}); attempting one repair")
+        repair = model.generate_content([REPAIR_PROMPT.replace("{error}", str(e)), text], generation_config=config)
+        try:
+            data = _parse_json(repair.text, expected_type)
+        except ValueError:
+            record(failed=True)
+            raise
+        record(repaired=True)
         return data
+
+def extract_review_data(image, raise_errors=False, stats=None):
+    """
+    Sends an image to Gemini 1.5 Flash to extract review data.
+    Returns a dictionary with Username, Date, Rating, and Content.
+    image is a PIL image or an already encoded {'mime_type', 'data'} blob.
+    With raise_errors, API errors propagate so a scheduler can retry them.
+    stats: an ExtractionStats to count the parse outcome in.
+    """
+    model = llm_utils.get_model(MODEL_NAME)
+    
+    try:
+        return _generate_json(model, [EXTRACTION_PROMPT, image], REVIEW_SCHEMA, dict, stats)
+    except Exception as e:
+        if raise_errors:
+            raise
+        return {"error": str(e)}
+
+def _image_tokens(width, height):
+    # ~258 tokens per 768px image tile
+    return max(1, -(-width // 768)) * max(1, -(-height // 768)) * 258
+
+def estimate_request_tokens(width, height):
+    """
+    Rough token cost of one extraction request, for the tokens-per-minute budget:
+    the image tiles plus the prompt and a short JSON answer.
+    """
+    return _image_tokens(width, height) + len(EXTRACTION_PROMPT) // 4 + 500
+
+def extraction_cache_key(image_bytes):
+    """Cache key for an image: SHA-256 of its bytes plus the prompt/model and preprocessing version."""
+    key = f"{hashlib.sha256(image_bytes).hexdigest()}:{EXTRACTION_VERSION}"
+    signature = image_utils.preprocess_signature()
+    return f"{key}:{signature}" if signature else key
+
+def _prepare_images(images_bytes):
+    """
+    Returns one dict per image with the 'image' to send to the model and its
+    'width', 'height' and payload 'bytes'. With preprocessing on, images are
+    cropped/downscaled/re-encoded in the process pool and sent as encoded blobs
+    (a PIL image would be re-encoded as lossless WebP by the SDK).
+    """
+    if image_utils.preprocess_signature():
+        prepared = []
+        for processed in image_utils.preprocess_many(images_bytes):
+            prepared.append({
+                'image': {'mime_type': processed['mime_type'], 'data': processed['data']},
+                'width': processed['width'],
+                'height': processed['height'],
+                'bytes': processed['bytes'],
+            })
+        return prepared
+    prepared = []
+    for image_bytes in images_bytes:
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            img.load()
+        prepared.append({'image': img, 'width': img.size[0], 'height': img.size[1], 'bytes': len(image_bytes)})
+    return prepared
+
+def is_extraction_cached(image_bytes):
+    """True if this exact image has a cached extraction for the current prompt/model."""
+    return cache_utils.get_extraction_cache().contains(extraction_cache_key(image_bytes))
+
+def _extract_single(prepared, scheduler=None, stats=None):
+    if scheduler is None:
+        return extract_review_data(prepared['image'], stats=stats)
+    try:
+        return scheduler.call(
+            lambda: extract_review_data(prepared['image'], raise_errors=True, stats=stats),
+            tokens=estimate_request_tokens(prepared['width'], prepared['height']),
+            stats=stats
+        )
     except Exception as e:
         return {"error": str(e)}
 
+def extract_review_data_cached(image_bytes, scheduler=None):
+    """
+    Like extract_review_data, but takes the raw image bytes and reuses a
+    previous extraction of the identical file from the persistent cache.
+    Cache misses are preprocessed (see image_utils) and go through
+    scheduler (rate limits + retries) when given.
+    Returns (data, cache_hit). Errors are never cached.
+    """
+    cache = cache_utils.get_extraction_cache()
+    key = extraction_cache_key(image_bytes)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached, True
+
+    data = _extract_single(_prepare_images([image_bytes])[0], scheduler)
+    if "error" not in data:
+        cache.put(key, data)
+    return data, False
+
+def extract_review_data_batch(images, raise_errors=False, stats=None):
+    """
+    Sends several review images in one request, so the instructions are only
+    sent once. Returns one record per image, in order.
+    Raises ValueError if the answer doesn't contain exactly one record per image.
+    stats: an ExtractionStats to count the parse outcome in.
+    """
+    model = llm_utils.get_model(MODEL_NAME)
+
+    try:
+        parts = [BATCH_EXTRACTION_PROMPT.replace("{count}", str(len(images)))]
+        for i, image in enumerate(images, start=1):
+            parts.extend([f"Image {i}:", image])
+        records = _generate_json(model, parts, BATCH_REVIEW_SCHEMA, list, stats)
+
+        if len(records) != len(images) or not all(isinstance(r, dict) for r in records):
+            raise ValueError(f"Expected {len(images)} records, got {len(records)}")
+        # Prefer the labels the model echoed back over its output order
+        labels = [str(r.pop('image', '')).strip() for r in records]
+        expected = [f"Image {i}" for i in range(1, len(images) + 1)]
+        if sorted(labels) == expected:
+            records = [records[labels.index(label)] for label in expected]
+        return records
+    except Exception as e:
+        if raise_errors:
+            raise
+        return [{"error": str(e)} for _ in images]
+
+def plan_batches(sizes, max_images=BATCH_MAX_IMAGES, max_bytes=BATCH_MAX_BYTES):
+    """
+    Greedily groups item indexes into batches of at most max_images items
+    and max_bytes of image payload, so large screenshots get smaller batches.
+    """
+    batches = []
+    current = []
+    current_bytes = 0
+    for i, size in enumerate(sizes):
+        if current and (len(current) >= max_images or current_bytes + size > max_bytes):
+            batches.append(current)
+            current = []
+            current_bytes = 0
+        current.append(i)
+        current_bytes += size
+    if current:
+        batches.append(current)
+    return batches
+
+def _extract_batch(prepared, scheduler, stats=None):
+    """Extracts one planned batch; images the batch call couldn't answer fall back to single calls."""
+    if len(prepared) == 1:
+        return [_extract_single(prepared[0], scheduler, stats)], 0
+
+    tokens = sum(_image_tokens(p['width'], p['height']) + 500 for p in prepared) + len(BATCH_EXTRACTION_PROMPT) // 4
+    try:
+        records = scheduler.call(
+            lambda: extract_review_data_batch([p['image'] for p in prepared], raise_errors=True, stats=stats),
+            tokens=tokens,
+            stats=stats
+        )
+    except Exception as e:
+        print(f"Batch of {len(prepared)} images failed ({e}); falling back to single requests")
+        records = [None] * len(prepared)
+
+    fallbacks = 0
+    results = []
+    for record, p in zip(records, prepared):
+        if record is None or not record.get('content') and not record.get('user_name'):
+            fallbacks += 1
+            record = _extract_single(p, scheduler, stats)
+        results.append(record)
+    return results, fallbacks
+
+def get_batch_size():
+    """Max screenshots per extraction request (OCR_BATCH_SIZE); 1 sends one request per image."""
+    return max(1, int(get_setting("OCR_BATCH_SIZE", BATCH_MAX_IMAGES)))
+
+def extract_reviews_batched(items, scheduler, max_images=BATCH_MAX_IMAGES, stats=None):
+    """
+    Extracts (name, image_bytes) items, packing cache misses max_images at a time
+    (fewer for large payloads) into single requests run concurrently by scheduler.
+    Yields (name, data, cache_hit, latency_seconds) as results come in.
+    Latency is the time of the request the image was part of.
+    stats: an ExtractionStats that counts only this run's requests and parses.
+    """
+    cache = cache_utils.get_extraction_cache()
+    misses = []
+    for name, image_bytes in items:
+        key = extraction_cache_key(image_bytes)
+        cached = cache.get(key)
+        if cached is not None:
+            yield name, cached, True, 0.0
+        else:
+            misses.append((name, key, image_bytes))
+    if not misses:
+        return
+
+    try:
+        prepared = _prepare_images([image_bytes for _, _, image_bytes in misses])
+    except Exception:
+        # One unreadable upload fails the whole pool map; prepare one by one to isolate it
+        prepared = []
+        for name, _, image_bytes in misses:
+            try:
+                prepared.append(_prepare_images([image_bytes])[0])
+            except Exception as e:
+                prepared.append({'error': f"Could not read image: {e}"})
+
+    readable = []
+    for i, p in enumerate(prepared):
+        if 'error' in p:
+            yield misses[i][0], {"error": p['error']}, False, 0.0
+        else:
+            readable.append(i)
+    groups = plan_batches([prepared[i]['bytes'] for i in readable], max_images=max_images)
+    batches = [[readable[j] for j in group] for group in groups]
+
+    def run(batch):
+        return _extract_batch([prepared[i] for i in batch], scheduler, stats)
+
+    for batch, output, error, latency in scheduler.map(run, batches):
+        records, _ = output if error is None else ([{"error": str(error)}] * len(batch), 0)
+        for i, data in zip(batch, records):
+            name, key, _ = misses[i]
+            if "error" not in data:
+                cache.put(key, data)
+            yield name, data, False, latency
+
 def analyze_sentiment_batch(reviews, language="English", stream=False):
     """
     Sends a batch of reviews to Gemini for sentiment analysis and recommendations.
     """
-    configure_genai()
-    # Using gemini-3-flash-preview as requested
-    model = genai.GenerativeModel('gemini-3-flash-preview')
+    model = llm_utils.get_model(MODEL_NAME)
     
     reviews_text = json.dumps(reviews, indent=2)
     
     # Calculate Sentiment Stats (in Python to ensure accuracy)
+    # Same buckets as the dashboard's sentiment charts
     total_reviews = len(reviews)
-    rating_counts = {1: 0, 2: 0, 3: 0, 4: 0, 5: 0}
-    sentiment_counts = {'Positive': 0, 'Neutral': 0, 'Negative': 0}
-    
-    for r in reviews:
-        try:
-            val = float(r.get('rating_overall', 0) or 0)
-            
-            # Sentiment bucket
-            if val >= 4.5:
-                sentiment_counts['Positive'] += 1
-            elif val > 3.5:
-                sentiment_counts['Neutral'] += 1
-            else:
-                sentiment_counts['Negative'] += 1
-        except:
-            pass
+    sentiment_counts = sentiment_utils.counts([r.get('rating_overall') for r in reviews])
+    unrated_line = (f"\n    - Unrated (no rating): {sentiment_counts['Unrated']} ({(sentiment_counts['Unrated']/total_reviews)*100:.1f}%)"
+                    if sentiment_counts['Unrated'] else "")
 
     stats_summary = f"""
     Total Reviews: {total_reviews}
@@ -94,7 +392,7 @@ def analyze_sentiment_batch(reviews, language="English", stream=False):
     Sentiment Breakdown (3 Categories):
     - Positive (4.5 - 5.0): {sentiment_counts['Positive']} ({(sentiment_counts['Positive']/total_reviews)*100:.1f}%)
     - Neutral (4.0): {sentiment_counts['Neutral']} ({(sentiment_counts['Neutral']/total_reviews)*100:.1f}%)
-    - Negative (<= 3.5): {sentiment_counts['Negative']} ({(sentiment_counts['Negative']/total_reviews)*100:.1f}%)
+    - Negative (<= 3.5): {sentiment_counts['Negative']} ({(sentiment_counts['Negative']/total_reviews)*100:.1f}%){unrated_line}
     """ if total_reviews > 0 else "No stats available."
 
     prompt = f"""
@@ -0,0 +1,207 @@
+import os
+import io
+import hashlib
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+from PIL import Image
+
+CACHE_DIR = ".cache"
+IMAGE_HASH_DB_PATH = os.path.join(CACHE_DIR, "image_hashes.sqlite3")
+# 24x24 gradient bits: review screenshots share most of their UI chrome, so a
+# coarse 8x8 hash can't tell different reviews apart
+HASH_SIZE = 24
+HASH_BYTES = HASH_SIZE * HASH_SIZE // 8
+# Max differing bits (out of 576) for two screenshots to count as the same review.
+# On uploads/ recompressed/rescaled copies stay under ~18, distinct reviews are 30+.
+DEFAULT_THRESHOLD = 24
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+def dhash(image, hash_size=HASH_SIZE):
+    """
+    Difference hash of a PIL image as packed bytes (hash_size**2 bits).
+    Robust to rescaling and recompression; similar images differ in few bits.
+    """
+    img = image.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
+    pixels = np.asarray(img, dtype=np.int16)
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return np.packbits(bits.flatten()).tobytes()
+
+def dhash_bytes(image_bytes):
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        return dhash(img)
+
+def content_key(image_bytes):
+    """Identity of a screenshot's exact bytes (hex SHA-256), used as the index key."""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+def hamming_distances(hashes, phash):
+    """Bit distances between each row of a (n, HASH_BYTES) uint8 array and one hash."""
+    diff = np.bitwise_xor(hashes, np.frombuffer(phash, dtype=np.uint8))
+    return np.unpackbits(diff, axis=1).sum(axis=1)
+
+def hash_distance(a, b):
+    """Bit distance between two hashes."""
+    return int(np.unpackbits(np.bitwise_xor(np.frombuffer(a, dtype=np.uint8), np.frombuffer(b, dtype=np.uint8))).sum())
+
+class ImageHashIndex:
+    """
+    Perceptual-hash index of previously ingested screenshots, persisted in SQLite
+    and held in memory as a uint8 matrix for vectorized Hamming-distance lookups.
+    Entries are keyed on the file's content hash (content_key), so different
+    screenshots uploaded under the same name (IMG_0001.PNG, ...) don't collide.
+    The SQLite file is shared with other processes (e.g. an external worker);
+    refresh() picks up what they added or marked failed.
+    """
+
+    def __init__(self, path=IMAGE_HASH_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            columns = [r[1] for r in conn.execute("PRAGMA table_info(image_hashes)")]
+            if columns and 'content_key' not in columns:
+                # Older index keyed on bare filenames; it is rebuilt from uploads/ by sync_directory
+                conn.execute("DROP TABLE image_hashes")
+                conn.execute("DROP TABLE IF EXISTS failed_images")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS image_hashes (
+                    content_key TEXT PRIMARY KEY,
+                    filename TEXT NOT NULL,
+                    phash BLOB NOT NULL,
+                    indexed_at REAL NOT NULL
+                )
+            """)
+            # Uploads whose extraction failed: kept out of the index (and out of
+            # sync_directory) so re-uploading them retries instead of being skipped
+            conn.execute("CREATE TABLE IF NOT EXISTS failed_images (content_key TEXT PRIMARY KEY, filename TEXT NOT NULL)")
+        self._keys = []
+        self._filenames = []
+        self._positions = {}
+        self._hashes = np.empty((0, HASH_BYTES), dtype=np.uint8)
+        self._failed = set()
+        self._known_names = set()
+        self._synced_at = 0.0
+        self.refresh()
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def refresh(self):
+        """Loads entries added or marked failed (by any process) since the last refresh."""
+        with self._lock:
+            with self._connect() as conn:
+                failed = conn.execute("SELECT content_key, filename FROM failed_images").fetchall()
+                # Overlap by a second: rows from another process may carry a slightly older clock
+                rows = conn.execute(
+                    "SELECT content_key, filename, phash, indexed_at FROM image_hashes WHERE indexed_at >= ? AND length(phash) = ?",
+                    (self._synced_at - 1.0, HASH_BYTES)
+                ).fetchall()
+            self._failed = {key for key, _ in failed}
+            self._known_names.update(name for _, name in failed)
+            for key, filename, phash, indexed_at in rows:
+                self._put(key, filename, phash)
+                self._synced_at = max(self._synced_at, indexed_at)
+            for key in self._failed & self._positions.keys():
+                self._remove(key)
+
+    def _put(self, key, filename, phash):
+        row = np.frombuffer(phash, dtype=np.uint8)
+        self._known_names.add(filename)
+        if key in self._positions:
+            position = self._positions[key]
+            self._filenames[position] = filename
+            self._hashes[position] = row
+        else:
+            self._positions[key] = len(self._keys)
+            self._keys.append(key)
+            self._filenames.append(filename)
+            self._hashes = np.vstack([self._hashes, row])
+
+    def _remove(self, key):
+        position = self._positions.pop(key, None)
+        if position is not None:
+            del self._keys[position]
+            del self._filenames[position]
+            self._hashes = np.delete(self._hashes, position, axis=0)
+            self._positions = {k: i for i, k in enumerate(self._keys)}
+
+    def add(self, filename, phash, key):
+        """Indexes a screenshot; key is content_key() of its bytes."""
+        with self._lock:
+            indexed_at = time.time()
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO image_hashes (content_key, filename, phash, indexed_at) VALUES (?, ?, ?, ?)",
+                    (key, filename, phash, indexed_at)
+                )
+                conn.execute("DELETE FROM failed_images WHERE content_key = ?", (key,))
+            self._failed.discard(key)
+            self._put(key, filename, phash)
+
+    def mark_failed(self, filename, key):
+        """Removes the screenshot from the index and keeps sync_directory from adding it back."""
+        with self._lock:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM image_hashes WHERE content_key = ?", (key,))
+                conn.execute("INSERT OR REPLACE INTO failed_images (content_key, filename) VALUES (?, ?)", (key, filename))
+            self._failed.add(key)
+            self._known_names.add(filename)
+            self._remove(key)
+
+    def find_match(self, phash, threshold=DEFAULT_THRESHOLD):
+        """Returns (filename, distance) of the closest indexed image within threshold, or None."""
+        with self._lock:
+            if not self._keys:
+                return None
+            distances = hamming_distances(self._hashes, phash)
+            best = int(np.argmin(distances))
+            if distances[best] <= threshold:
+                return self._filenames[best], int(distances[best])
+            return None
+
+    def sync_directory(self, directory):
+        """
+        Refreshes from SQLite, then indexes images in directory whose name the
+        index hasn't seen yet (indexed or failed); returns how many were added.
+        """
+        self.refresh()
+        if not os.path.isdir(directory):
+            return 0
+        added = 0
+        for name in sorted(os.listdir(directory)):
+            if name in self._known_names or not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            try:
+                with open(os.path.join(directory, name), "rb") as f:
+                    image_bytes = f.read()
+                key = content_key(image_bytes)
+                if key in self._failed:
+                    continue
+                self.add(name, dhash_bytes(image_bytes), key)
+                added += 1
+            except Exception as e:
+                print(f"Could not hash {name}: {e}")
+        return added
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_image_hash_index():
+    """Returns the process-wide image hash index."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = ImageHashIndex()
+        return _index
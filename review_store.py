@@ -0,0 +1,99 @@
+import datetime
+import numpy as np
+import pandas as pd
+import sentiment_utils
+from normalize_utils import RATING_COLUMNS
+
+_ONE_DAY = pd.Timedelta(days=1)
+
+class ReviewStore:
+    """
+    Reviews sorted on a DatetimeIndex of their review day, with the derived
+    columns the dashboard filters and groups on (date, sentiment) computed once.
+    Date queries binary-search the index and return views, so they cost
+    O(log n) plus the size of the result instead of a scan over every row.
+    Reviews without a review_date can't be placed on the index; they are kept
+    apart in undated. The frames returned are shared; treat them as read-only.
+    """
+
+    def __init__(self, df):
+        self._build(self.prepare(df))
+
+    @staticmethod
+    def prepare(df):
+        """Raw review rows with review_date parsed, the derived columns added and the day index set (unsorted)."""
+        df = df.copy()
+        # read_sql returns object dtype for a column that is NULL in every row fetched
+        ratings = [c for c in RATING_COLUMNS if c in df.columns]
+        df[ratings] = df[ratings].apply(pd.to_numeric, errors='coerce').astype(float)
+        dates = pd.to_datetime(df['review_date'])
+        df['review_date'] = dates
+        df['date'] = dates.dt.date
+        df['sentiment'] = sentiment_utils.classify(df['rating_overall'])
+        df.index = pd.DatetimeIndex(dates.dt.normalize(), name='day')
+        return df
+
+    def apply_changes(self, drop_ids, added):
+        """
+        A new store without the rows whose id is in drop_ids and with added
+        (rows from prepare()) merged in; this store is left as it is.
+        New rows are only parsed and classified once, in prepare().
+        """
+        df = pd.concat([self.df, self.undated]) if not self.undated.empty else self.df
+        df = df[~df['id'].isin(list(drop_ids))] if drop_ids else df
+        if not added.empty:
+            df = pd.concat([df, added]) if not df.empty else added
+        store = ReviewStore.__new__(ReviewStore)
+        store._build(df)
+        return store
+
+    def _build(self, df):
+        dated = df.index.notna()
+        self.undated = df[~dated]
+        self.df = df[dated].sort_index(kind='stable')
+        # Row positions (in date order) and days of each sentiment, for per-category slicing
+        codes = self.df['sentiment'].cat.codes.to_numpy()
+        self._by_sentiment = {}
+        for code, label in enumerate(sentiment_utils.LABELS):
+            positions = np.flatnonzero(codes == code)
+            self._by_sentiment[label] = (positions, self.df.index[positions])
+
+    def __len__(self):
+        return len(self.df)
+
+    @property
+    def empty(self):
+        return self.df.empty
+
+    @property
+    def min_date(self):
+        return self.df.index[0].date() if len(self.df) else None
+
+    @property
+    def max_date(self):
+        return self.df.index[-1].date() if len(self.df) else None
+
+    def _bounds(self, days, start, end):
+        """Positions [lo, hi) in days covering start..end (inclusive dates; None is open)."""
+        lo = 0 if start is None else days.searchsorted(pd.Timestamp(start), side='left')
+        hi = len(days) if end is None else days.searchsorted(pd.Timestamp(end) + _ONE_DAY, side='left')
+        return lo, hi
+
+    def range(self, start=None, end=None):
+        """Reviews dated start..end inclusive (datetime.date or anything pd.Timestamp accepts)."""
+        lo, hi = self._bounds(self.df.index, start, end)
+        return self.df.iloc[lo:hi]
+
+    def last_n_days(self, days):
+        """Reviews from `days` days before the latest review day through that day."""
+        if self.empty:
+            return self.df
+        return self.range(self.max_date - datetime.timedelta(days=days), self.max_date)
+
+    def sentiment(self, label, start=None, end=None):
+        """Reviews with the given sentiment label (see sentiment_utils.LABELS) dated start..end inclusive."""
+        if label not in self._by_sentiment:
+            return self.df.iloc[0:0]
+        positions, days = self._by_sentiment[label]
+        lo, hi = self._bounds(days, start, end)
+        return self.df.iloc[positions[lo:hi]]
@@ -0,0 +1,158 @@
+import time
+import random
+import threading
+import concurrent.futures
+import streamlit as st
+from config_utils import get_setting
+
+# Defaults, overridable with OCR_MAX_WORKERS / GEMINI_RPM / GEMINI_TPM in secrets or env
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_REQUESTS_PER_MINUTE = 60
+DEFAULT_TOKENS_PER_MINUTE = 1_000_000
+DEFAULT_MAX_RETRIES = 5
+BASE_BACKOFF = 1.0
+MAX_BACKOFF = 32.0
+# Rate-limit and transient server errors worth retrying
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at rate_per_minute."""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount=1):
+        """Blocks until amount tokens are available; returns seconds waited."""
+        # A single request larger than the bucket would otherwise wait forever
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return waited
+                delay = (amount - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+def is_retryable(exc):
+    """True for 429/5xx API errors and network timeouts."""
+    # google.api_core exceptions carry the HTTP status as .code
+    code = getattr(exc, 'code', None)
+    if isinstance(code, int) and code in RETRYABLE_STATUS_CODES:
+        return True
+    return isinstance(exc, (TimeoutError, ConnectionError))
+
+class CallStats:
+    """Thread-safe counters for calls made through a RequestScheduler."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.throttle_wait = 0.0
+
+    def record_call(self, waited):
+        with self.lock:
+            self.calls += 1
+            self.throttle_wait += waited
+
+    def record_retry(self):
+        with self.lock:
+            self.retries += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {'calls': self.calls, 'retries': self.retries, 'throttle_wait': self.throttle_wait}
+
+class RequestScheduler:
+    """
+    Runs model calls under a requests-per-minute and tokens-per-minute budget,
+    with bounded concurrency and exponential backoff (full jitter) on
+    rate-limit and transient server errors.
+    map() runs on one executor owned by the scheduler, so max_workers bounds
+    the concurrency of all callers together, not of each map() call.
+    """
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+                 tokens_per_minute=DEFAULT_TOKENS_PER_MINUTE, max_retries=DEFAULT_MAX_RETRIES):
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self._totals = CallStats()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scheduler")
+
+    def call(self, fn, tokens=0, stats=None):
+        """
+        Calls fn() within the rate limits, retrying retryable errors. Re-raises the last error.
+        stats: a CallStats for the caller's own counters (e.g. one job), on top of the process totals.
+        """
+        counters = [self._totals] + ([stats] if stats is not None else [])
+        attempt = 0
+        while True:
+            waited = self.request_bucket.acquire(1)
+            if tokens:
+                waited += self.token_bucket.acquire(tokens)
+            for counter in counters:
+                counter.record_call(waited)
+            try:
+                return fn()
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = random.uniform(0, min(MAX_BACKOFF, BASE_BACKOFF * (2 ** attempt)))
+                print(f"Retryable model error ({e}); retrying in {delay:.1f}s")
+                for counter in counters:
+                    counter.record_retry()
+                time.sleep(delay)
+                attempt += 1
+
+    def map(self, fn, items):
+        """
+        Runs fn(item) for each item on the scheduler's max_workers threads,
+        queued behind any other map() calls in flight.
+        Yields (item, result, error, latency_seconds) as each one completes.
+        fn must not call map() itself (it would wait on its own workers).
+        """
+        def timed(item):
+            start = time.perf_counter()
+            try:
+                return item, fn(item), None, time.perf_counter() - start
+            except Exception as e:
+                return item, None, e, time.perf_counter() - start
+
+        futures = [self._executor.submit(timed, item) for item in items]
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                yield future.result()
+        finally:
+            # The caller stopped early: don't leave its queued items holding up other callers
+            for future in futures:
+                future.cancel()
+
+    def stats(self):
+        """Counters for every call this scheduler has made (all sessions and jobs)."""
+        return self._totals.snapshot()
+
+@st.cache_resource
+def get_scheduler():
+    """
+    Returns the process-wide scheduler, configured from OCR_MAX_WORKERS /
+    GEMINI_RPM / GEMINI_TPM. Shared so concurrent sessions split one API budget.
+    """
+    return RequestScheduler(
+        max_workers=int(get_setting("OCR_MAX_WORKERS", DEFAULT_MAX_WORKERS)),
+        requests_per_minute=float(get_setting("GEMINI_RPM", DEFAULT_REQUESTS_PER_MINUTE)),
+        tokens_per_minute=float(get_setting("GEMINI_TPM", DEFAULT_TOKENS_PER_MINUTE)),
+    )
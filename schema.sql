@@ -1,3 +1,6 @@
+-- Baseline schema (migration 1 in migrations.py). Secondary indexes and
+-- backfills are separate migrations so they can run online.
+
 CREATE TABLE IF NOT EXISTS reviews (
     id SERIAL PRIMARY KEY,
     user_name VARCHAR(255),
@@ -13,5 +16,43 @@ CREATE TABLE IF NOT EXISTS reviews (
     image_path TEXT,
     source_filename TEXT,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    UNIQUE(username, content)
+    -- SHA-256 of normalized user_name + content (see db_utils.compute_content_hash)
+    content_hash CHAR(64)
 );
+
+-- Existing tables: add the dedup key
+ALTER TABLE reviews ADD COLUMN IF NOT EXISTS content_hash CHAR(64);
+
+-- Change tracking for incremental refreshes (see db_utils.get_all_reviews)
+ALTER TABLE reviews ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+
+CREATE TABLE IF NOT EXISTS review_tombstones (
+    review_id INTEGER PRIMARY KEY,
+    deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE OR REPLACE FUNCTION reviews_touch_updated_at() RETURNS trigger AS $$
+BEGIN
+    -- An UPDATE that sets updated_at itself (e.g. a backfill) keeps its value
+    IF NEW.updated_at IS NOT DISTINCT FROM OLD.updated_at THEN
+        NEW.updated_at := CURRENT_TIMESTAMP;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER trg_reviews_touch_updated_at
+    BEFORE UPDATE ON reviews
+    FOR EACH ROW EXECUTE FUNCTION reviews_touch_updated_at();
+
+CREATE OR REPLACE FUNCTION reviews_record_tombstone() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO review_tombstones (review_id) VALUES (OLD.id)
+    ON CONFLICT (review_id) DO UPDATE SET deleted_at = EXCLUDED.deleted_at;
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER trg_reviews_record_tombstone
+    AFTER DELETE ON reviews
+    FOR EACH ROW EXECUTE FUNCTION reviews_record_tombstone();
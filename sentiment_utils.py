@@ -0,0 +1,25 @@
+import numpy as np
+import pandas as pd
+
+# Buckets on rating_overall, shared by the dashboard charts and the AI report
+SENTIMENTS = ['Positive', 'Neutral', 'Negative']
+UNRATED = 'Unrated'
+LABELS = SENTIMENTS + [UNRATED]
+POSITIVE_MIN = 4.5    # rating >= 4.5
+NEUTRAL_ABOVE = 3.5   # 3.5 < rating < 4.5; anything lower is Negative
+
+def _codes(ratings):
+    """Positions in LABELS for each rating; missing or non-numeric ratings are Unrated."""
+    values = np.asarray(pd.to_numeric(ratings, errors='coerce'), dtype=float)
+    return np.select(
+        [values >= POSITIVE_MIN, values > NEUTRAL_ABOVE, values <= NEUTRAL_ABOVE],
+        [0, 1, 2], default=3
+    ).astype(np.int8)
+
+def classify(ratings):
+    """Sentiment label per rating, as a Categorical with categories LABELS."""
+    return pd.Categorical.from_codes(_codes(ratings), categories=LABELS)
+
+def counts(ratings):
+    """{label: number of ratings} for every label in LABELS."""
+    return dict(zip(LABELS, np.bincount(_codes(ratings), minlength=len(LABELS)).tolist()))
@@ -0,0 +1,79 @@
+import os
+import json
+import datetime
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:  # Snapshots are an optimisation; the app works without them
+    pa = None
+
+SNAPSHOT_DIR = ".cache"
+SNAPSHOT_FILE = os.path.join(SNAPSHOT_DIR, "reviews_snapshot.arrow")
+# Bump when the snapshot layout changes so old files are ignored
+SNAPSHOT_FORMAT = 1
+
+def snapshots_enabled():
+    return pa is not None
+
+def _encode_stamp(stamp):
+    encoded = {}
+    for key, value in stamp.items():
+        encoded[key] = value.isoformat() if isinstance(value, datetime.datetime) else value
+    return json.dumps(encoded).encode("utf-8")
+
+def _decode_stamp(raw):
+    stamp = json.loads(raw.decode("utf-8"))
+    for key in ('max_updated_at', 'max_deleted_at'):
+        if stamp.get(key):
+            stamp[key] = datetime.datetime.fromisoformat(stamp[key])
+    return stamp
+
+def save_snapshot(df, stamp, path=SNAPSHOT_FILE):
+    """
+    Writes the reviews DataFrame to an uncompressed Arrow IPC file so it can be
+    memory-mapped on the next start. stamp (high-water marks, schema version)
+    is stored in the file's schema metadata.
+    """
+    if pa is None:
+        return False
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        metadata = dict(table.schema.metadata or {})
+        metadata[b"snapshot_stamp"] = _encode_stamp(dict(stamp, format=SNAPSHOT_FORMAT))
+        table = table.replace_schema_metadata(metadata)
+
+        # Write then rename, so a crash never leaves a half-written snapshot
+        tmp_path = path + ".tmp"
+        with pa.OSFile(tmp_path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+        return True
+    except Exception as e:
+        print(f"Error saving snapshot: {e}")
+        return False
+
+def load_snapshot(expected_schema_version, path=SNAPSHOT_FILE):
+    """
+    Memory-maps the snapshot and returns (df, stamp).
+    Returns (None, None) if there is no usable snapshot, or if it was written
+    for a different snapshot format or schema version.
+    """
+    if pa is None or not os.path.exists(path):
+        return None, None
+    try:
+        with pa.memory_map(path, "r") as source:
+            reader = pa.ipc.open_file(source)
+            raw = (reader.schema.metadata or {}).get(b"snapshot_stamp")
+            if raw is None:
+                return None, None
+            stamp = _decode_stamp(raw)
+            if stamp.get('format') != SNAPSHOT_FORMAT or stamp.get('schema_version') != expected_schema_version:
+                print("Ignoring stale snapshot (format or schema version changed).")
+                return None, None
+            return reader.read_all().to_pandas(), stamp
+    except Exception as e:
+        print(f"Error loading snapshot: {e}")
+        return None, None
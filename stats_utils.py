@@ -0,0 +1,146 @@
+import threading
+import numpy as np
+import pandas as pd
+import streamlit as st
+import db_utils
+from review_store import ReviewStore
+from normalize_utils import RATING_COLUMNS
+
+MOVING_AVG_COLUMNS = ['mov_avg_overall', 'mov_avg_taste', 'mov_avg_env', 'mov_avg_service', 'mov_avg_value']
+# Moving averages and review counts cover the last N calendar days
+WINDOW = 7
+
+_SUM_COLUMNS = [f'{col}_sum' for col in RATING_COLUMNS]
+_COUNT_COLUMNS = [f'{col}_count' for col in RATING_COLUMNS]
+_TOTAL_COLUMNS = _SUM_COLUMNS + _COUNT_COLUMNS + ['daily_count']
+
+class DailyAggregator:
+    """
+    Running per-day totals: the sum and number of (non-empty) ratings for each
+    rating category plus the number of reviews. add()/remove() touch only the
+    days of the rows given, so keeping the totals current costs O(changed rows);
+    daily_stats() derives the means and rolling windows from them per day.
+    """
+
+    def __init__(self):
+        self.totals = pd.DataFrame(columns=_TOTAL_COLUMNS, dtype=float)
+
+    def _day_totals(self, df):
+        ratings = df[RATING_COLUMNS]
+        per_row = pd.concat([
+            ratings.fillna(0).set_axis(_SUM_COLUMNS, axis=1),
+            ratings.notna().astype(float).set_axis(_COUNT_COLUMNS, axis=1),
+        ], axis=1)
+        per_row['daily_count'] = 1.0
+        return per_row.groupby(df['date'].to_numpy()).sum()
+
+    def _apply(self, df, sign):
+        if df.empty:
+            return
+        delta = self._day_totals(df)
+        new_days = delta.index.difference(self.totals.index)
+        if len(new_days):
+            zeros = pd.DataFrame(0.0, index=new_days, columns=_TOTAL_COLUMNS)
+            self.totals = pd.concat([self.totals, zeros]).sort_index() if not self.totals.empty else zeros
+        self.totals.loc[delta.index, _TOTAL_COLUMNS] += sign * delta[_TOTAL_COLUMNS]
+
+    def add(self, df):
+        """Counts reviews in (rows with the date column and ratings, e.g. ReviewStore.df)."""
+        self._apply(df, 1)
+
+    def remove(self, df):
+        """Takes previously added reviews back out."""
+        self._apply(df, -1)
+
+    def daily_stats(self):
+        """
+        One row per calendar day from the first to the last review (days without
+        reviews included): daily rating means, 7-day moving averages (all ratings
+        in the day and the 6 before it), daily_count and rolling_7d_count.
+        """
+        totals = self.totals[self.totals['daily_count'] > 0]
+        if totals.empty:
+            return pd.DataFrame(columns=RATING_COLUMNS + MOVING_AVG_COLUMNS + ['daily_count', 'rolling_7d_count'])
+        # A complete date index makes the rolling windows account for days with 0 reviews
+        full_date_range = pd.date_range(start=totals.index.min(), end=totals.index.max(), freq='D').date
+        totals = totals.reindex(full_date_range, fill_value=0.0)
+        window = totals.rolling(window=WINDOW, min_periods=1).sum()
+
+        counts, window_counts = totals[_COUNT_COLUMNS].to_numpy(), window[_COUNT_COLUMNS].to_numpy()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            # Daily means stay NaN on days without ratings (no data points)
+            means = np.where(counts > 0, totals[_SUM_COLUMNS].to_numpy() / counts, np.nan)
+            moving = np.where(window_counts > 0, window[_SUM_COLUMNS].to_numpy() / window_counts, np.nan)
+        daily_stats = pd.concat([
+            pd.DataFrame(means, index=totals.index, columns=RATING_COLUMNS),
+            pd.DataFrame(moving, index=totals.index, columns=MOVING_AVG_COLUMNS),
+        ], axis=1)
+        # After a week without ratings the last average persists, as before
+        daily_stats[MOVING_AVG_COLUMNS] = daily_stats[MOVING_AVG_COLUMNS].ffill()
+        daily_stats['daily_count'] = totals['daily_count']
+        daily_stats['rolling_7d_count'] = window['daily_count']
+        return daily_stats
+
+def compute_daily_stats(store):
+    """Daily stats (see DailyAggregator.daily_stats) for every review in a ReviewStore."""
+    aggregator = DailyAggregator()
+    aggregator.add(store.df)
+    return aggregator.daily_stats()
+
+def slice_daily(daily_stats, start=None, end=None):
+    """Rows of daily_stats between start and end (dates, inclusive); None leaves that side open."""
+    return daily_stats.loc[start:end]
+
+class _StatsCache:
+    """The review store, daily totals and stats, with the data version and change generation they reflect."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.generation = None
+        self.store = None
+        self.aggregator = None
+        self.daily = None
+
+    def rebuild(self, generation):
+        df = db_utils.get_all_reviews(columns=db_utils.ANALYSIS_COLUMNS)
+        if df.empty:
+            df = pd.DataFrame(columns=db_utils.ANALYSIS_COLUMNS)
+        self.store = ReviewStore(df)
+        self.aggregator = DailyAggregator()
+        self.aggregator.add(self.store.df)
+        self.generation = generation
+
+    def apply(self, generation, changes):
+        for drop_ids, added in changes:
+            removed = self.store.df[self.store.df['id'].isin(list(drop_ids))]
+            added = ReviewStore.prepare(added[[c for c in db_utils.ANALYSIS_COLUMNS if c in added.columns]])
+            self.aggregator.remove(removed)
+            self.aggregator.add(added)
+            self.store = self.store.apply_changes(drop_ids, added)
+        self.generation = generation
+
+@st.cache_resource
+def _get_stats_cache():
+    return _StatsCache()
+
+def get_analysis_data():
+    """
+    Returns (ReviewStore, daily_stats) for the Analysis tab; the store is
+    empty if there are no reviews. Nothing is recomputed while
+    db_utils.get_reviews_version() is unchanged; after an ingestion only the
+    changed reviews are folded in. The same frames are handed to every
+    caller, so treat them as read-only.
+    """
+    cache = _get_stats_cache()
+    version = db_utils.get_reviews_version()
+    with cache.lock:
+        if version is None or version != cache.version or cache.store is None:
+            generation, changes = db_utils.get_review_changes(cache.generation)
+            if changes is None or cache.store is None:
+                cache.rebuild(generation)
+            else:
+                cache.apply(generation, changes)
+            cache.daily = cache.aggregator.daily_stats()
+            cache.version = version
+        return cache.store, cache.daily
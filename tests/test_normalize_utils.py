@@ -0,0 +1,61 @@
+import datetime
+import pandas as pd
+import pytest
+import normalize_utils
+
+TODAY = datetime.date(2026, 10, 18)
+
+def normalize_date(raw, today=TODAY):
+    dates, fallback = normalize_utils.normalize_dates(pd.Series([raw], dtype=object), today=today)
+    return dates.iloc[0].date(), bool(fallback.iloc[0])
+
+@pytest.mark.parametrize("raw, expected", [
+    ("2025-03-01", datetime.date(2025, 3, 1)),
+    ("2025年12月28日", datetime.date(2025, 12, 28)),
+    ("10/18", datetime.date(2026, 10, 18)),
+    ("10-01", datetime.date(2026, 10, 1)),
+    ("12/29 18:37", datetime.date(2025, 12, 29)),
+])
+def test_dates(raw, expected):
+    assert normalize_date(raw) == (expected, False)
+
+def test_month_day_after_today_rolls_back_a_year():
+    assert normalize_date("12/29") == (datetime.date(2025, 12, 29), False)
+    assert normalize_date("10/19") == (datetime.date(2025, 10, 19), False)
+    assert normalize_date("12月29日") == (datetime.date(2025, 12, 29), False)
+
+def test_month_day_year_follows_today():
+    assert normalize_date("12/29", today=datetime.date(2027, 1, 5)) == (datetime.date(2026, 12, 29), False)
+    assert normalize_date("01/02", today=datetime.date(2027, 1, 5)) == (datetime.date(2027, 1, 2), False)
+
+def test_leap_day_uses_the_last_leap_year_in_reach():
+    assert normalize_date("02/29", today=datetime.date(2025, 1, 5)) == (datetime.date(2024, 2, 29), False)
+
+@pytest.mark.parametrize("raw", [None, "", "yesterday"])
+def test_unreadable_dates_fall_back_to_today(raw):
+    assert normalize_date(raw) == (TODAY, True)
+
+def test_normalize_records():
+    batch = normalize_utils.normalize_records([
+        {'user_name': "A", 'review_date': "12/29", 'rating_overall': "4.5", 'content': "Good"},
+        {'user_name': "B", 'review_date': None, 'rating_overall': 7, 'rating_taste': "n/a"},
+        {'user_name': "C", 'review_date': "2026-01-02", 'rating_overall': -1},
+    ], today=TODAY)
+
+    df = batch.df
+    assert str(df['review_date'].dtype).startswith('datetime64')
+    assert df['review_date'].dt.date.tolist() == [datetime.date(2025, 12, 29), TODAY, datetime.date(2026, 1, 2)]
+    assert df['rating_overall'].tolist() == [4.5, 5.0, 0.0]
+    assert pd.isna(df['rating_taste'].iloc[1])
+    assert df['content'].isna().tolist() == [False, True, True]
+    assert sorted((e['row'], e['field']) for e in batch.errors) == [
+        (1, 'rating_overall'), (1, 'rating_taste'), (1, 'review_date'), (2, 'rating_overall'),
+    ]
+
+def test_to_records():
+    batch = normalize_utils.normalize_records([{'user_name': "A", 'review_date': "2026-01-02", 'rating_overall': 4}], today=TODAY)
+    record = batch.to_records()[0]
+    assert record['review_date'] == "2026-01-02"
+    assert record['rating_overall'] == 4.0
+    assert record['rating_env'] is None
+    assert record['content'] is None
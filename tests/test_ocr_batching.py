@@ -0,0 +1,87 @@
+import io
+import json
+import numpy as np
+import pytest
+from PIL import Image
+import cache_utils
+import llm_utils
+import ocr_utils
+import scheduler_utils
+
+def png(seed, size=(60, 40)):
+    rng = np.random.default_rng(seed)
+    out = io.BytesIO()
+    Image.fromarray(rng.integers(0, 255, (size[1], size[0], 3), dtype=np.uint8)).save(out, format="PNG")
+    return out.getvalue()
+
+class ShortBatchModel(llm_utils.FakeModel):
+    """Answers batch requests with one record too few, so the batch falls back to single requests."""
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        response = super().generate_content(contents, stream=stream, **kwargs)
+        records = json.loads(response.text)
+        if isinstance(records, list):
+            return llm_utils._FakeResponse(json.dumps(records[:-1]))
+        return response
+
+class ShortBatchBackend(llm_utils.FakeBackend):
+    def make_model(self, name, system_instruction=None):
+        return ShortBatchModel(name, system_instruction)
+
+@pytest.fixture
+def fake_llm(monkeypatch, tmp_path):
+    """Fake model backend, a fresh extraction cache and no preprocessing."""
+    monkeypatch.setenv("PREPROCESS_ENABLED", "false")
+    monkeypatch.setitem(llm_utils._BACKEND_FACTORIES, 'short_batch', ShortBatchBackend)
+    monkeypatch.setattr(cache_utils, '_cache', cache_utils.ExtractionCache(path=str(tmp_path / "extractions.sqlite3")))
+
+    def use(backend):
+        monkeypatch.setattr(llm_utils, '_client', llm_utils.LLMClient(backend))
+    use('fake')
+    return use
+
+def run(items, max_images):
+    stats = ocr_utils.ExtractionStats()
+    scheduler = scheduler_utils.RequestScheduler(max_workers=2)
+    results = list(ocr_utils.extract_reviews_batched(items, scheduler, max_images=max_images, stats=stats))
+    return {name: (data, cache_hit) for name, data, cache_hit, _ in results}, stats.snapshot()
+
+def test_plan_batches_respects_image_count():
+    assert ocr_utils.plan_batches([1] * 7, max_images=3) == [[0, 1, 2], [3, 4, 5], [6]]
+    assert ocr_utils.plan_batches([], max_images=3) == []
+
+def test_plan_batches_respects_payload_size():
+    sizes = [4, 4, 4, 10, 1, 1]
+    assert ocr_utils.plan_batches(sizes, max_images=8, max_bytes=9) == [[0, 1], [2], [3], [4, 5]]
+
+def test_extract_reviews_batched(fake_llm):
+    items = [(f"shot{i}.png", png(i)) for i in range(5)]
+    results, stats = run(items, max_images=2)
+
+    assert sorted(results) == sorted(name for name, _ in items)
+    assert all('error' not in data and not cache_hit for data, cache_hit in results.values())
+    assert {data['user_name'] for data, _ in results.values()} <= {"Fake User 1", "Fake User 2"}
+    # 5 images, 2 per request
+    assert stats['calls'] == 3
+    assert stats['responses'] == 3 and stats['failed'] == 0
+
+def test_repeat_images_come_from_the_cache(fake_llm):
+    items = [(f"shot{i}.png", png(i)) for i in range(3)]
+    run(items, max_images=8)
+    results, stats = run(items, max_images=8)
+    assert all(cache_hit for _, cache_hit in results.values())
+    assert stats['calls'] == 0
+
+def test_unreadable_image_fails_alone(fake_llm):
+    items = [("good1.png", png(1)), ("broken.png", b"not an image"), ("good2.png", png(2))]
+    results, _ = run(items, max_images=8)
+    assert 'error' in results["broken.png"][0]
+    assert 'error' not in results["good1.png"][0] and 'error' not in results["good2.png"][0]
+
+def test_short_batch_answer_falls_back_to_single_requests(fake_llm):
+    fake_llm('short_batch')
+    items = [(f"shot{i}.png", png(i)) for i in range(3)]
+    results, stats = run(items, max_images=3)
+    assert all('error' not in data for data, _ in results.values())
+    # One batch request, then one request per image
+    assert stats['calls'] == 4
@@ -0,0 +1,137 @@
+import datetime
+import numpy as np
+import pandas as pd
+import pandas.testing as pdt
+import pytest
+import stats_utils
+from review_store import ReviewStore
+
+COLUMNS = ['id', 'review_date', 'rating_overall', 'rating_taste', 'rating_env', 'rating_service', 'rating_value']
+
+def make_reviews(n, start_id=1, seed=0):
+    rng = np.random.default_rng(seed)
+    days = pd.Timestamp("2026-01-01") + pd.to_timedelta(rng.integers(0, 60, n), unit="D")
+    df = pd.DataFrame({
+        'id': np.arange(start_id, start_id + n),
+        'review_date': days.strftime("%Y-%m-%d"),
+        'rating_overall': rng.choice([1.0, 3.0, 3.5, 4.0, 4.5, 5.0], n),
+    })
+    for column in COLUMNS[3:]:
+        values = rng.choice([2.0, 3.0, 4.0, 5.0], n)
+        df[column] = np.where(rng.random(n) < 0.2, np.nan, values)
+    return df
+
+def apply_to_frame(df, drop_ids, added):
+    rest = df[~df['id'].isin(drop_ids)]
+    return pd.concat([rest, added], ignore_index=True)
+
+def assert_same_store(a, b):
+    key = lambda store: store.df.reset_index().sort_values(['day', 'id'], ignore_index=True)
+    pdt.assert_frame_equal(key(a), key(b), check_dtype=False, check_categorical=False)
+    assert sorted(a.undated['id']) == sorted(b.undated['id'])
+
+def test_range_matches_a_mask():
+    df = make_reviews(300)
+    store = ReviewStore(df)
+    start, end = datetime.date(2026, 1, 10), datetime.date(2026, 1, 20)
+    dates = pd.to_datetime(df['review_date']).dt.date
+    expected = df[(dates >= start) & (dates <= end)]
+    assert sorted(store.range(start, end)['id']) == sorted(expected['id'])
+    assert len(store.range()) == len(df)
+    assert store.min_date == dates.min() and store.max_date == dates.max()
+
+def test_last_n_days_and_sentiment():
+    df = make_reviews(300)
+    store = ReviewStore(df)
+    dates = pd.to_datetime(df['review_date']).dt.date
+    since = dates.max() - datetime.timedelta(days=7)
+    assert sorted(store.last_n_days(7)['id']) == sorted(df.loc[dates >= since, 'id'])
+
+    positive = store.sentiment('Positive', datetime.date(2026, 1, 5), datetime.date(2026, 2, 5))
+    in_range = (dates >= datetime.date(2026, 1, 5)) & (dates <= datetime.date(2026, 2, 5))
+    assert sorted(positive['id']) == sorted(df.loc[in_range & (df['rating_overall'] >= 4.5), 'id'])
+    assert store.sentiment('Unknown').empty
+
+def test_undated_and_object_ratings():
+    df = make_reviews(20)
+    df.loc[3, 'review_date'] = None
+    # read_sql returns object dtype for a column that is NULL in every row
+    df['rating_env'] = pd.Series([None] * len(df), dtype=object)
+    store = ReviewStore(df)
+    assert store.undated['id'].tolist() == [4]
+    assert len(store) == 19
+    assert store.df.index.is_monotonic_increasing
+    assert store.df['rating_env'].dtype == float
+
+def test_apply_changes_matches_rebuild():
+    df = make_reviews(200)
+    store = ReviewStore(df)
+    edited = df[df['id'].isin([5, 6, 7])].assign(rating_overall=1.0, review_date="2026-03-15")
+    added = pd.concat([edited, make_reviews(30, start_id=1000, seed=1)], ignore_index=True)
+    drop_ids = {5, 6, 7, 10, 11}
+
+    updated = store.apply_changes(drop_ids, ReviewStore.prepare(added))
+    assert_same_store(updated, ReviewStore(apply_to_frame(df, drop_ids, added)))
+    # The original store is left as it was
+    assert len(store) == 200
+
+def test_aggregator_incremental_matches_rebuild():
+    df = make_reviews(500)
+    store = ReviewStore(df)
+    aggregator = stats_utils.DailyAggregator()
+    aggregator.add(store.df)
+    pdt.assert_frame_equal(aggregator.daily_stats(), stats_utils.compute_daily_stats(store))
+
+    drop_ids = set(range(1, 40))
+    added = ReviewStore.prepare(pd.concat([
+        df[df['id'].isin(range(1, 20))].assign(rating_overall=2.0),
+        make_reviews(50, start_id=1000, seed=2),
+    ], ignore_index=True))
+    aggregator.remove(store.df[store.df['id'].isin(drop_ids)])
+    aggregator.add(added)
+
+    rebuilt = stats_utils.compute_daily_stats(ReviewStore(apply_to_frame(df, drop_ids, added.reset_index(drop=True)[COLUMNS])))
+    pdt.assert_frame_equal(aggregator.daily_stats(), rebuilt, check_freq=False)
+
+def test_daily_stats_windows():
+    df = pd.DataFrame({
+        'id': [1, 2, 3],
+        'review_date': ["2026-01-01", "2026-01-01", "2026-01-09"],
+        'rating_overall': [5.0, 3.0, 1.0],
+    })
+    for column in COLUMNS[3:]:
+        df[column] = np.nan
+    daily = stats_utils.compute_daily_stats(ReviewStore(df))
+    assert len(daily) == 9
+    assert daily['daily_count'].tolist() == [2, 0, 0, 0, 0, 0, 0, 0, 1]
+    assert daily.loc[datetime.date(2026, 1, 7), 'rolling_7d_count'] == 2
+    assert daily.loc[datetime.date(2026, 1, 8), 'rolling_7d_count'] == 0
+    assert daily.loc[datetime.date(2026, 1, 1), 'rating_overall'] == 4.0
+    assert np.isnan(daily.loc[datetime.date(2026, 1, 2), 'rating_overall'])
+    # The 7-day average carries forward across empty days, then covers the new day
+    assert daily.loc[datetime.date(2026, 1, 8), 'mov_avg_overall'] == 4.0
+    assert daily.loc[datetime.date(2026, 1, 9), 'mov_avg_overall'] == 1.0
+
+@pytest.mark.parametrize("replay", [False, True])
+def test_stats_cache_apply_matches_rebuild(replay):
+    df = make_reviews(300)
+    cache = stats_utils._StatsCache()
+    cache.store = ReviewStore(df)
+    cache.aggregator = stats_utils.DailyAggregator()
+    cache.aggregator.add(cache.store.df)
+
+    added = pd.concat([
+        df[df['id'].isin([1, 2, 3])].assign(rating_overall=1.0),
+        make_reviews(25, start_id=5000, seed=3),
+    ], ignore_index=True)
+    # As db_utils builds them: every changed id is dropped, then its new version added
+    drop_ids = set(added['id']) | {50, 51}
+    changes = [(drop_ids, added)]
+    cache.apply(1, changes)
+    if replay:
+        # A delta seen twice (e.g. read before and after a refresh) must not double count
+        cache.apply(1, changes)
+
+    expected = ReviewStore(apply_to_frame(df, drop_ids, added))
+    assert_same_store(cache.store, expected)
+    pdt.assert_frame_equal(cache.aggregator.daily_stats(), stats_utils.compute_daily_stats(expected), check_freq=False)
@@ -0,0 +1,24 @@
+import numpy as np
+import pandas as pd
+import sentiment_utils
+
+def test_counts_buckets():
+    ratings = pd.Series([5.0, 4.5, 4.4, 4.0, 3.6, 3.5, 1.0, 0.0, None, np.nan])
+    assert sentiment_utils.counts(ratings) == {'Positive': 2, 'Neutral': 3, 'Negative': 3, 'Unrated': 2}
+
+def test_counts_includes_every_label():
+    assert sentiment_utils.counts(pd.Series([], dtype=float)) == {label: 0 for label in sentiment_utils.LABELS}
+
+def test_counts_non_numeric_are_unrated():
+    ratings = pd.Series(["5", "4.0", "great", None], dtype=object)
+    assert sentiment_utils.counts(ratings) == {'Positive': 1, 'Neutral': 1, 'Negative': 0, 'Unrated': 2}
+
+def test_counts_accepts_lists():
+    assert sentiment_utils.counts([4.8, 2.0])['Negative'] == 1
+
+def test_classify_matches_counts():
+    ratings = pd.Series([4.5, 3.5, 4.0, None])
+    labels = sentiment_utils.classify(ratings)
+    assert list(labels) == ['Positive', 'Negative', 'Neutral', 'Unrated']
+    assert list(labels.categories) == sentiment_utils.LABELS
+    assert pd.Series(labels).value_counts().to_dict() == {k: v for k, v in sentiment_utils.counts(ratings).items() if v}
@@ -0,0 +1,209 @@
+"""
+Background worker for the job queue (see job_utils).
+
+Runs OCR extraction and report generation outside the Streamlit script
+thread, so the work survives reruns, page reloads and reconnects.
+
+Usage:
+    python worker.py                  # run until interrupted
+    python worker.py --concurrency 4  # jobs processed at the same time
+
+Set JOB_WORKER = "external" in the app's secrets when running this
+separately; otherwise the app runs the same loop in-process.
+"""
+import os
+import time
+import socket
+import argparse
+import threading
+import pandas as pd
+import streamlit as st
+import db_utils
+import job_utils
+import ocr_utils
+import phash_utils
+import scheduler_utils
+import config_utils
+
+POLL_INTERVAL = 2.0
+# Don't write progress to the database more often than this
+PROGRESS_INTERVAL = 1.0
+
+class _Progress:
+    """Throttled progress reporter handed to job handlers."""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self._last = 0.0
+
+    def __call__(self, progress, message=None, partial_result=None, force=False):
+        now = time.monotonic()
+        if force or now - self._last >= PROGRESS_INTERVAL:
+            self._last = now
+            job_utils.update_progress(self.job_id, progress, message, partial_result)
+
+def run_extract_job(payload, progress):
+    """
+    payload: {'files': [[filename, path], ...]} of screenshots saved to uploads/.
+    In embedded mode the app also stages the bytes in memory ('staged_files'),
+    so extraction doesn't wait for the copies in uploads/ to be written.
+    Returns the extracted records (deduplicated within the batch), per-file errors and timing stats.
+    """
+    files = payload['files']
+    scheduler = scheduler_utils.get_scheduler()
+    hash_index = phash_utils.get_image_hash_index()
+    staged = payload.get('staged_files') or {}
+    items = []
+    paths = {}
+    for fname, fpath in files:
+        if fname in staged:
+            items.append((fname, staged[fname]))
+        else:
+            with open(fpath, "rb") as f:
+                items.append((fname, f.read()))
+        paths[fname] = fpath
+
+    records = []
+    errors = []
+    duplicates = []
+    latencies = []
+    seen_hashes = set()
+    cache_hits = 0
+    # Counters for this job only; the scheduler is shared with other jobs and sessions
+    job_stats = ocr_utils.ExtractionStats()
+    image_bytes = dict(items)
+    results = ocr_utils.extract_reviews_batched(items, scheduler, max_images=ocr_utils.get_batch_size(), stats=job_stats)
+    for i, (fname, data, cache_hit, latency) in enumerate(results):
+        cache_hits += int(cache_hit)
+        latencies.append({'File': fname, 'Seconds': round(latency, 2), 'Cached': cache_hit, 'Error': data.get('error', '')})
+        if "error" in data:
+            errors.append([fname, data['error']])
+            hash_index.mark_failed(fname, phash_utils.content_key(image_bytes[fname]))
+        else:
+            # Only successfully extracted screenshots count as already processed
+            try:
+                hash_index.add(fname, phash_utils.dhash_bytes(image_bytes[fname]), phash_utils.content_key(image_bytes[fname]))
+            except Exception as e:
+                print(f"Could not hash {fname}: {e}")
+            # Batch duplicate check logic (same key as the DB unique index)
+            content_hash = db_utils.compute_content_hash(data.get('user_name'), data.get('content'))
+            if content_hash in seen_hashes:
+                duplicates.append(fname)
+            else:
+                seen_hashes.add(content_hash)
+                data['source_filename'] = fname
+                data['image_path'] = paths[fname]
+                records.append(data)
+        progress((i + 1) / len(items), f"Extracted {i + 1}/{len(items)} images")
+
+    stats = job_stats.snapshot()
+    return {
+        'records': records,
+        'errors': errors,
+        'duplicates': duplicates,
+        'latencies': latencies,
+        'cache_hits': cache_hits,
+        'requests': stats['calls'],
+        'retries': stats['retries'],
+        'throttle_wait': stats['throttle_wait'],
+        'responses': stats['responses'],
+        'repaired': stats['repaired'],
+        'parse_failed': stats['failed'],
+    }
+
+def run_report_job(payload, progress):
+    """
+    payload: {'start', 'end', 'language'}; start/end are YYYY-MM-DD review_date bounds.
+    Returns {'report': markdown, 'metadata': {...}}. The partial report is published while it streams.
+    """
+    df = db_utils.get_reviews(columns=db_utils.REPORT_COLUMNS, start=payload['start'], end=payload['end'])
+    if df.empty:
+        raise ValueError("No reviews found in the selected date range to analyze.")
+    dates = pd.to_datetime(df['review_date'])
+    df['review_date'] = dates.dt.strftime('%Y-%m-%d')
+    metadata = {
+        'start_date': dates.min().strftime('%Y-%m-%d'),
+        'end_date': dates.max().strftime('%Y-%m-%d'),
+        'count': len(df),
+        'generated_on': pd.Timestamp.today().strftime('%Y-%m-%d'),
+    }
+
+    progress(0.1, f"Analyzing {len(df)} reviews...", force=True)
+    report_stream = ocr_utils.analyze_sentiment_batch(df[db_utils.REPORT_COLUMNS].to_dict(orient='records'),
+                                                      language=payload.get('language', 'English'), stream=True)
+    if isinstance(report_stream, str):
+        raise RuntimeError(report_stream)
+
+    report = ""
+    for chunk in report_stream:
+        if hasattr(chunk, 'text'):
+            report += chunk.text
+            progress(0.5, "Writing report...", partial_result={'report': report, 'metadata': metadata})
+    return {'report': report, 'metadata': metadata}
+
+HANDLERS = {
+    'extract': run_extract_job,
+    'report': run_report_job,
+}
+
+def run_job(job):
+    progress = _Progress(job['id'])
+    payload = job['payload']
+    staged = job_utils.take_staged(job['id'])
+    if staged is not None:
+        payload = dict(payload, staged_files=staged)
+    try:
+        with job_utils.heartbeat(job['id']):
+            result = HANDLERS[job['kind']](payload, progress)
+        job_utils.complete_job(job['id'], result)
+    except Exception as e:
+        print(f"Job {job['id']} ({job['kind']}) failed: {e}")
+        job_utils.fail_job(job['id'], str(e))
+
+def _worker_loop(worker_id, stop_event):
+    while not stop_event.is_set():
+        # No-op once the schema is in place (the app bootstraps it in the background)
+        db_utils.bootstrap_schema()
+        job_utils.requeue_stale_jobs()
+        job = job_utils.claim_job(worker_id, HANDLERS.keys())
+        if job is None:
+            stop_event.wait(POLL_INTERVAL)
+            continue
+        print(f"[{worker_id}] Running job {job['id']} ({job['kind']}, attempt {job['attempts']})")
+        run_job(job)
+
+def start_workers(concurrency=1, stop_event=None):
+    """Starts concurrency daemon threads that consume the job queue; returns them."""
+    stop_event = stop_event or threading.Event()
+    host = f"{socket.gethostname()}:{os.getpid()}"
+    threads = []
+    for i in range(concurrency):
+        thread = threading.Thread(target=_worker_loop, args=(f"{host}/{i}", stop_event), daemon=True)
+        thread.start()
+        threads.append(thread)
+    return threads
+
+@st.cache_resource
+def start_embedded_workers():
+    """Runs the worker inside the app process, once per server process (JOB_WORKER_CONCURRENCY threads)."""
+    return start_workers(job_utils.worker_concurrency())
+
+if __name__ == "__main__":
+    config_utils.load_secrets_into_env()
+
+    parser = argparse.ArgumentParser(description="Process queued extraction and report jobs.")
+    parser.add_argument("--concurrency", type=int, default=2, help="Jobs processed at the same time.")
+    args = parser.parse_args()
+
+    db_utils.bootstrap_schema()
+    stop = threading.Event()
+    workers = start_workers(args.concurrency, stop)
+    print(f"Worker started with {args.concurrency} thread(s). Press Ctrl+C to stop.")
+    try:
+        while any(t.is_alive() for t in workers):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("Stopping after the current jobs finish...")
+        stop.set()
+        for t in workers:
+            t.join()